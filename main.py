@@ -7,38 +7,230 @@ import os
 import sys
 import traceback
 from concurrent.futures import ThreadPoolExecutor
-from typing import Callable
+from typing import Callable, Optional
 
 # Third-party libraries
 from loguru import logger
 
 # Project libraries
 import src.default as df
+from src.base_connector import BaseConnector, DatagramSocket
 from src.client import ClientConnector
-from src.load_config import Config
+from src.dispatcher import Dispatcher
+from src.handoff import HandedSocket, HandoffServer, request_handoff
+from src.load_config import Config, TunnelConfig
 from src.packet_converter import PacketConverter
+from src.packet_filter import PacketFilter
+from src.poll import Poller, PollQueue
+from src.probe import PathProber
 from src.server import ServerConnector
+from src.traffic_capture import CaptureWriter
 
+MAX_SERVICES_PER_TUNNEL = 2  # the path prober and poller, the rest are shared
 
-def auto_restart_service(service: Callable[[], None], name: str) -> Callable[[], None]:
+
+def auto_restart_service(
+    service: Callable[[], None], name: str, tunnel: str = ""
+) -> Callable[[], None]:
     """Automatically restarts the function if an exception is thrown
 
     Args:
         service: function or method to automatically restart
         name: Name of the service (for logging only)
+        tunnel: Name of the tunnel the service belongs to (for logging only)
     """
 
     def wrapped():
-        try:
-            service()
-        except Exception as e:
-            logger.error(f"[{name}] Crashed: {e}\n{traceback.format_exc()}")
-        else:
-            logger.error(f"[{name}] Exited cleanly, restarting...")
+        with logger.contextualize(tunnel=tunnel):
+            try:
+                service()
+            except Exception as e:
+                logger.error(f"[{name}] Crashed: {e}\n{traceback.format_exc()}")
+            else:
+                logger.error(f"[{name}] Exited cleanly, restarting...")
 
     return wrapped
 
 
+def get_socket(
+    handed: Optional[HandedSocket],
+    socket_factory: Optional[Callable[[], DatagramSocket]],
+    port: Optional[int] = None,
+) -> Optional[DatagramSocket]:
+    """Returns the socket handed over for a connector, a socket created by
+    socket_factory or None to let the connector create its own socket
+
+    Args:
+        handed: The socket handed over by the previous process
+        socket_factory: Creates the connector sockets instead of real UDP sockets
+        port: The port a listening connector binds to, a handed socket bound to another
+            port is closed as the config has changed
+
+    Returns:
+        The socket for the connector or None
+    """
+    if handed is not None:
+        if port is None or handed.sock.getsockname()[1] == port:
+            return handed.sock
+        handed.sock.close()
+    return socket_factory() if socket_factory is not None else None
+
+
+def start_tunnel(
+    config: TunnelConfig,
+    loop: asyncio.AbstractEventLoop,
+    executor: ThreadPoolExecutor,
+    dispatcher: Dispatcher,
+    log_name: str,
+    socket_factory: Optional[Callable[[], DatagramSocket]] = None,
+    handed: Optional[dict[str, HandedSocket]] = None,
+) -> dict[str, BaseConnector]:
+    """Creates the connectors and packet converter of a tunnel, adds them to the
+    shared services and schedules the tunnel's own timers on the shared executor
+
+    Args:
+        config: The tunnel config
+        loop: The shared event loop
+        executor: The worker pool, sized to one thread per service
+        dispatcher: Runs the listener, converter and transmitter of every tunnel
+        log_name: Prefix added to the tunnel's log messages
+        socket_factory: Creates the connector sockets instead of real UDP sockets,
+            I.E: SimulatedNetwork.socket
+        handed: The sockets and session state handed over by the previous process,
+            keyed by connector name
+
+    Returns:
+        The connectors of the tunnel keyed by connector name
+    """
+    handed = handed or {}
+    # Create sub-directories if they don't exist
+    for directory in df.DIRECTORY_PATHS:
+        os.makedirs(
+            name=f"{df.CLIENT_DIR}/{df.get_spool_path(config.spool_dir, directory)}/",
+            exist_ok=True,
+        )
+
+    # Configure sub-processes, the connector facing the raw data serves channel 0
+    client = ClientConnector(
+        config=config.client,
+        sock=get_socket(handed.get("client"), socket_factory),
+        channel=0 if config.mode == "server" else None,
+    )
+    server = ServerConnector(
+        config=config.server,
+        sock=get_socket(handed.get("server"), socket_factory, port=config.server.port),
+        channel=0 if config.mode == "client" else None,
+    )
+    packet = PacketConverter(config=config.packet)
+    packet.channels |= {channel.id for channel in config.channels}
+
+    # Every multiplexed channel gets its own connector facing the raw data
+    channel_connector = ServerConnector if config.mode == "client" else ClientConnector
+    channels = [
+        channel_connector(
+            config=channel.connector,
+            sock=get_socket(
+                handed.get(f"channel-{channel.id}"),
+                socket_factory,
+                port=channel.connector.port if config.mode == "client" else None,
+            ),
+            channel=channel.id,
+        )
+        for channel in config.channels
+    ]
+    connectors = {"client": client, "server": server} | {
+        f"channel-{connector.channel}": connector for connector in channels
+    }
+
+    # Record the assembled packets sent by the tunnel
+    if config.capture_path is not None:
+        capture = CaptureWriter(file_path=config.capture_path)
+        if config.mode == "client":
+            client.capture = capture
+        else:
+            server.capture = capture
+        logger.info(f"{log_name}Recording assembled packets to {config.capture_path}")
+
+    # Drop junk received from the remote side before it is spooled, the assembler tags
+    # the packets sent to the remote instance
+    if (
+        config.packet.filter
+        or config.packet.filter_key
+        or config.packet.filter_rate > 0
+    ):
+        packet.packet_filter = PacketFilter(
+            protocol=config.packet.protocol,
+            header_check=config.packet.filter,
+            key=config.packet.filter_key,
+            rate=config.packet.filter_rate,
+            burst=config.packet.filter_burst,
+        )
+        remote = client if config.mode == "client" else server
+        remote.packet_filter = packet.packet_filter
+
+    # A relay that does not change the packets forwards them between the sockets
+    # without the spool and packet converter
+    if (
+        config.packet.protocol == "none"
+        and config.packet.encoding == "none"
+        and not config.packet.framing
+    ):
+        logger.info(f"{log_name}Relaying packets without spooling")
+        dispatcher.add_tunnel(
+            log_name=log_name,
+            connectors=list(connectors.values()),
+            relay=(client, server),
+        )
+    else:
+        dispatcher.add_tunnel(
+            log_name=log_name, connectors=list(connectors.values()), packet=packet
+        )
+    services = []
+
+    # Probe the path through the tunnel, the results drive the adaptive pacer of the
+    # connector facing the remote instance
+    if config.packet.probe_interval > 0:
+        remote_pacer = client.pacer if config.mode == "client" else server.pacer
+        packet.prober = PathProber(
+            interval=config.packet.probe_interval,
+            send_probe=packet.inject_frame,
+            on_update=remote_pacer.set_loss if remote_pacer is not None else None,
+        )
+        services.append((packet.prober.probe_service, "path-prober"))
+
+    # Hold the polls of the client mode instance so the server mode instance can send
+    # downstream data as soon as it is queued
+    if config.packet.poll_hold > 0:
+        if config.mode == "server":
+            server.polls = PollQueue(
+                hold=config.packet.poll_hold, timeout=config.packet.poll_timeout
+            )
+        else:
+            packet.poller = Poller(
+                hold=config.packet.poll_hold,
+                interval=config.packet.poll_interval,
+                max_interval=config.packet.poll_max_interval,
+                timeout=config.packet.poll_timeout,
+                send_poll=packet.inject_frame,
+            )
+            services.append((packet.poller.poll_service, "poller"))
+
+    # Restore the session state handed over by the previous process
+    for name, connector in connectors.items():
+        if (state := handed.get(name)) is not None and connector.sock is state.sock:
+            connector.tx_address = state.tx_address
+            if connector.polls is not None:
+                for address in state.polls:
+                    connector.polls.add(address)
+
+    # create threads
+    for service, name in services:
+        loop.run_in_executor(
+            executor, auto_restart_service(service, name, tunnel=log_name)
+        )
+    return connectors
+
+
 def main():
     """Main entry point for the tunnel_over_anything client application"""
     # Parse command line arguments
@@ -57,66 +249,93 @@ def main():
     # Load config
     config = Config.load_config(file_path=args.config.strip())
 
-    # Set the log format
+    # Set the log format, messages of a multi-tunnel config are prefixed with the tunnel
     logger.remove()
+    logger.configure(extra={"tunnel": ""})
     logger.add(
         sys.stderr,
-        format="<level>{time:YYYY-MM-DD HH:mm:ss} | {level: <5} | {message}</level>",
+        format="<level>{time:YYYY-MM-DD HH:mm:ss} | {level: <5} | {extra[tunnel]}{message}</level>",
         colorize=True,
+        enqueue=True,
         level=config.log_level,
     )
 
-    # Create sub-directories if they don't exist
-    for directory in df.DIRECTORY_PATHS:
-        os.makedirs(name=f"{df.CLIENT_DIR}/{directory}/", exist_ok=True)
-
-    # Configure sub-processes
-    client = ClientConnector(config=config.client)
-    server = ServerConnector(config=config.server)
-    packet = PacketConverter(config=config.packet)
+    # Take the sockets over from a running instance, this waits until it has exited
+    handed = {}
+    if config.handoff_path is not None:
+        handed = request_handoff(path=config.handoff_path)
 
-    # Start process workers
-    executor = ThreadPoolExecutor(max_workers=6)
+    # Start process workers, the shared services, the timers of every tunnel and the
+    # handoff service each run on their own thread
+    dispatcher = Dispatcher()
+    executor = ThreadPoolExecutor(
+        max_workers=len(dispatcher.services())
+        + MAX_SERVICES_PER_TUNNEL * len(config.tunnels)
+        + 1
+    )
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
 
-    # create threads
-    loop.run_in_executor(
-        executor,
-        auto_restart_service(client.transmit_service, "client-transmitter"),
-    )
-    loop.run_in_executor(
-        executor, auto_restart_service(client.listener_service, "client-listener")
-    )
-    loop.run_in_executor(
-        executor,
-        auto_restart_service(server.transmit_service, "server-transmitter"),
-    )
-    loop.run_in_executor(
-        executor, auto_restart_service(server.listener_service, "server-listener")
-    )
-    loop.run_in_executor(
-        executor, auto_restart_service(packet.assembler_service, "packet-assembler")
-    )
-    loop.run_in_executor(
-        executor,
-        auto_restart_service(packet.disassembler_service, "packet-disassembler"),
-    )
+    connectors = {}
+    for tunnel in config.tunnels:
+        tunnel_connectors = start_tunnel(
+            config=tunnel,
+            loop=loop,
+            executor=executor,
+            dispatcher=dispatcher,
+            log_name=f"[{tunnel.name}] " if len(config.tunnels) > 1 else "",
+            handed={
+                name.partition("/")[2]: state
+                for name, state in handed.items()
+                if name.partition("/")[0] == tunnel.name
+            },
+        )
+        for name, connector in tunnel_connectors.items():
+            connectors[f"{tunnel.name}/{name}"] = connector
+
+    for service, name in dispatcher.services():
+        loop.run_in_executor(executor, auto_restart_service(service, name))
+
+    # Close the handed sockets of connectors that are no longer configured
+    in_use = {id(connector.sock) for connector in connectors.values()}
+    for state in handed.values():
+        if id(state.sock) not in in_use:
+            state.sock.close()
+
+    # Hand the sockets over to the next instance started with the same handoff_path
+    if config.handoff_path is not None:
+        handoff = HandoffServer(
+            path=config.handoff_path, connectors=connectors, dispatcher=dispatcher
+        )
+        loop.run_in_executor(
+            executor, auto_restart_service(handoff.handoff_service, "handoff")
+        )
 
     # run loop until stopped
     try:
         loop.run_forever()
     finally:
         logger.info("Shutting down Tunnel over Anything")
+        # write out the buffered datagrams of the recording captures
+        for capture in {
+            connector.capture
+            for connector in connectors.values()
+            if connector.capture is not None
+        }:
+            capture.close()
         deleted_file_count = 0
-        for directory in df.DIRECTORY_PATHS:
-            for file in os.listdir(path=f"{df.CLIENT_DIR}/{directory}"):
-                file_path = f"{df.CLIENT_DIR}/{directory}/{file}"
-                if not os.path.isfile(file_path) or not file_path.endswith(".bin"):
-                    continue
-                logger.debug(f"Deleting file {file_path}")
-                os.remove(path=file_path)
-                deleted_file_count += 1
+        for tunnel in config.tunnels:
+            for directory in df.DIRECTORY_PATHS:
+                spool_path = df.get_spool_path(tunnel.spool_dir, directory)
+                for file in os.listdir(path=f"{df.CLIENT_DIR}/{spool_path}"):
+                    file_path = f"{df.CLIENT_DIR}/{spool_path}/{file}"
+                    if not os.path.isfile(file_path) or not file_path.endswith(
+                        (".bin", ".tmp")
+                    ):
+                        continue
+                    logger.debug(f"Deleting file {file_path}")
+                    os.remove(path=file_path)
+                    deleted_file_count += 1
         if deleted_file_count > 0:
             logger.info(f"Deleted {deleted_file_count} binary files")
 
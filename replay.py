@@ -0,0 +1,82 @@
+"""Replays the UDP traffic of a pcap/pcapng file into a local tunnel_over_anything instance"""
+
+# Standard libraries
+import argparse
+import sys
+import time
+
+# Third-party libraries
+from loguru import logger
+
+# Project libraries
+from src.traffic_capture import read_capture, replay_capture
+
+
+def main():
+    """Main entry point for the tunnel_over_anything replay tool"""
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(
+        description="Replays captured UDP traffic into a Tunnel over Anything server connector"
+    )
+    parser.add_argument("pcap", help="Path to the pcap or pcapng file to replay")
+    parser.add_argument(
+        "--endpoint",
+        "-e",
+        help="Address of the server connector",
+        default="127.0.0.1",
+        required=False,
+    )
+    parser.add_argument(
+        "--port", "-p", help="Port of the server connector", type=int, required=True
+    )
+    parser.add_argument(
+        "--filter-port",
+        "-f",
+        help="Only replay datagrams sent from or to this port",
+        type=int,
+        default=None,
+        required=False,
+    )
+    parser.add_argument(
+        "--speed",
+        "-s",
+        help="Replay speed multiplier, 0 replays as fast as possible",
+        type=float,
+        default=1.0,
+        required=False,
+    )
+    parser.add_argument(
+        "--loop",
+        "-l",
+        help="Number of times to replay the capture",
+        type=int,
+        default=1,
+        required=False,
+    )
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(
+        sys.stderr,
+        format="<level>{time:YYYY-MM-DD HH:mm:ss} | {level: <5} | {message}</level>",
+        colorize=True,
+        level="INFO",
+    )
+
+    packets = read_capture(file_path=args.pcap, port=args.filter_port)
+    logger.info(f"[replay] Loaded {len(packets)} UDP datagrams from {args.pcap}")
+
+    for iteration in range(args.loop):
+        start = time.perf_counter()
+        transmitted = replay_capture(
+            packets=packets, endpoint=args.endpoint, port=args.port, speed=args.speed
+        )
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"[replay] Pass {iteration + 1}/{args.loop} sent {len(packets)} datagrams "
+            f"({transmitted} bytes) to {args.endpoint}:{args.port} in {elapsed:.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
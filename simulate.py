@@ -0,0 +1,228 @@
+"""Runs the full client -> server -> client tunnel pipeline over a simulated network in a
+single process and reports the delivered throughput and latency"""
+
+# Standard libraries
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-party libraries
+from loguru import logger
+
+# Project libraries
+import src.default as df
+from main import MAX_SERVICES_PER_TUNNEL, auto_restart_service, start_tunnel
+from src.dispatcher import Dispatcher
+from src.load_config import TunnelConfig
+from src.simulator import LinkProfile, SimulatedNetwork
+
+SIMULATION_PATH = "simulation"
+APPLICATION_ADDRESS = ("127.0.0.3", 7000)
+EDGE_ADDRESS = ("127.0.0.1", 5001)
+CORE_ADDRESS = ("10.0.0.2", 53)
+SERVICE_ADDRESS = ("127.0.0.2", 6000)
+HEADER_LENGTH = 12  # 4 byte sequence number and 8 byte send timestamp
+
+
+def build_tunnels(packet: dict) -> list[TunnelConfig]:
+    """Builds the client mode (edge) and server mode (core) tunnels
+
+    Args:
+        packet: The [packet] config shared by both tunnels
+
+    Returns:
+        The edge and core tunnel configs
+    """
+    edge = {
+        "mode": "client",
+        "client": {"endpoint": CORE_ADDRESS[0], "port": CORE_ADDRESS[1]},
+        "server": {"endpoint": EDGE_ADDRESS[0], "port": EDGE_ADDRESS[1]},
+        "packet": packet,
+    }
+    core = {
+        "mode": "server",
+        "client": {"endpoint": SERVICE_ADDRESS[0], "port": SERVICE_ADDRESS[1]},
+        "server": {"endpoint": CORE_ADDRESS[0], "port": CORE_ADDRESS[1]},
+        "packet": packet,
+    }
+    return [
+        TunnelConfig.from_dict(data, name=name, spool_dir=f"{SIMULATION_PATH}/{name}")
+        for name, data in (("edge", edge), ("core", core))
+    ]
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of the samples, 0 if there are none"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def main():
+    """Main entry point for the tunnel_over_anything network simulator"""
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(
+        description="Runs Tunnel over Anything over a simulated network"
+    )
+    parser.add_argument("--protocol", default="dns", help="Packet protocol")
+    parser.add_argument("--encoding", default="base85", help="Packet encoding")
+    parser.add_argument(
+        "--bandwidth", type=float, default=0, help="Link bytes/s, 0 is unlimited"
+    )
+    parser.add_argument("--delay", type=float, default=0.02, help="One way delay (s)")
+    parser.add_argument("--jitter", type=float, default=0, help="Delay jitter (s)")
+    parser.add_argument("--loss", type=float, default=0, help="Loss probability")
+    parser.add_argument(
+        "--reorder", type=float, default=0, help="Reordering probability"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="Simulated seconds per real second, scales the link timing only",
+    )
+    parser.add_argument("--count", type=int, default=200, help="Packets to send")
+    parser.add_argument("--size", type=int, default=500, help="Packet size (bytes)")
+    parser.add_argument("--rate", type=float, default=100, help="Packets per second")
+    parser.add_argument(
+        "--timeout", type=float, default=5, help="Seconds to wait for stragglers"
+    )
+    parser.add_argument("--log-level", default="WARNING", help="Tunnel log level")
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the delivered sequence numbers in arrival order as JSON",
+    )
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.configure(extra={"tunnel": ""})
+    logger.add(
+        sys.stderr,
+        format="<level>{time:YYYY-MM-DD HH:mm:ss} | {level: <5} | {extra[tunnel]}{message}</level>",
+        colorize=True,
+        enqueue=True,
+        level=args.log_level.upper(),
+    )
+
+    network = SimulatedNetwork(seed=args.seed, time_scale=args.time_scale)
+    network.impair(
+        CORE_ADDRESS[0],
+        LinkProfile(
+            bandwidth=args.bandwidth,
+            delay=args.delay,
+            jitter=args.jitter,
+            loss=args.loss,
+            reorder=args.reorder,
+        ),
+    )
+
+    # Start both tunnels on a shared worker pool
+    tunnels = build_tunnels({"protocol": args.protocol, "encoding": args.encoding})
+    dispatcher = Dispatcher()
+    executor = ThreadPoolExecutor(
+        max_workers=len(dispatcher.services()) + MAX_SERVICES_PER_TUNNEL * len(tunnels)
+    )
+    loop = asyncio.new_event_loop()
+    for tunnel in tunnels:
+        start_tunnel(
+            config=tunnel,
+            loop=loop,
+            executor=executor,
+            dispatcher=dispatcher,
+            log_name=f"[{tunnel.name}] ",
+            socket_factory=network.socket,
+        )
+    for service, name in dispatcher.services():
+        loop.run_in_executor(executor, auto_restart_service(service, name))
+
+    # Echo service behind the core tunnel
+    service = network.socket()
+    service.bind(SERVICE_ADDRESS)
+
+    def echo_service():
+        while True:
+            data, address = service.recvfrom()
+            service.sendto(data, address)
+
+    threading.Thread(target=echo_service, daemon=True).start()
+
+    # Application in front of the edge tunnel
+    application = network.socket()
+    application.bind(APPLICATION_ADDRESS)
+    round_trip_times = []
+    received = set()
+    arrivals = []
+    last_received = [0.0]
+
+    def application_listener():
+        while True:
+            data, _ = application.recvfrom()
+            sequence = int.from_bytes(data[:4], byteorder="big")
+            sent_at = int.from_bytes(data[4:HEADER_LENGTH], byteorder="big") / 1e9
+            if sequence not in received:
+                received.add(sequence)
+                arrivals.append(sequence)
+                round_trip_times.append(network.clock.now() - sent_at)
+                last_received[0] = network.clock.now()
+
+    threading.Thread(target=application_listener, daemon=True).start()
+
+    padding = bytes(max(args.size - HEADER_LENGTH, 0))
+    start = network.clock.now()
+    for sequence in range(args.count):
+        application.sendto(
+            b"".join(
+                [
+                    sequence.to_bytes(length=4, byteorder="big"),
+                    int(network.clock.now() * 1e9).to_bytes(length=8, byteorder="big"),
+                    padding,
+                ]
+            ),
+            EDGE_ADDRESS,
+        )
+        time.sleep(network.clock.to_real(1 / args.rate))
+
+    deadline = time.monotonic() + args.timeout
+    while len(received) < args.count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    elapsed = max(last_received[0] - start, 1e-9)
+
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "count": args.count,
+                    "delivered": list(arrivals),
+                    "link_sent": network.sent,
+                    "link_dropped": network.dropped,
+                }
+            )
+        )
+    else:
+        print(
+            f"delivered {len(received)}/{args.count} packets "
+            f"({1 - len(received) / args.count:.1%} loss) "
+            f"goodput {len(received) * args.size / elapsed:.0f} B/s | "
+            f"rtt p50 {percentile(round_trip_times, 0.5) * 1000:.1f}ms "
+            f"p99 {percentile(round_trip_times, 0.99) * 1000:.1f}ms | "
+            f"link datagrams {network.sent} dropped {network.dropped}"
+        )
+
+    # The tunnel services never return, exit without waiting for the worker pool
+    logger.remove()
+    shutil.rmtree(f"{df.CLIENT_DIR}/{SIMULATION_PATH}", ignore_errors=True)
+    sys.stdout.flush()
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 """Base connector class for transmitting and receiving"""
 
 # Standard libraries
-import socket
-from typing import Literal, Optional
+import os
+from typing import TYPE_CHECKING, Literal, Optional, Protocol, runtime_checkable
 
 # Third-party libraries
 from attrs import define, field, validators
@@ -10,6 +10,43 @@ from loguru import logger
 
 # Project libraries
 import src.default as df
+from src.buffer_pool import BufferPool
+from src.pacer import Pacer
+from src.packet_filter import PacketFilter
+from src.poll import PollQueue
+from src.scheduler import TransmitScheduler, get_channel
+from src.traffic_capture import CaptureWriter
+from src.traffic_stats import TrafficCounter
+
+if TYPE_CHECKING:
+    from src.client import ClientConnector
+    from src.server import ServerConnector
+
+
+@runtime_checkable
+class DatagramSocket(Protocol):
+    """The subset of the socket.socket UDP interface used by the connectors, also
+    implemented by SimulatedSocket"""
+
+    def bind(self, address: tuple[str, int]): ...
+
+    def connect(self, address: tuple[str, int]): ...
+
+    def getsockname(self) -> tuple[str, int]: ...
+
+    def getpeername(self) -> tuple[str, int]: ...
+
+    def settimeout(self, timeout: Optional[float]): ...
+
+    def sendto(self, data: bytes | memoryview, address: tuple[str, int]) -> int: ...
+
+    def send(self, data: bytes | memoryview) -> int: ...
+
+    def recvfrom_into(self, buffer: bytearray) -> tuple[int, tuple[str, int]]: ...
+
+    def close(self): ...
+
+    def fileno(self) -> int: ...
 
 
 @define
@@ -29,55 +66,277 @@ class BaseConnector:
     )
     recv_path: str = field(validator=validators.instance_of(str))
     tx_path: str = field(validator=validators.instance_of(str))
-    sock: socket.socket = field(validator=validators.instance_of(socket.socket))
+    sock: DatagramSocket = field(validator=validators.instance_of(DatagramSocket))
     tx_address: tuple[str, int] = field()
+    pool: BufferPool = field(validator=validators.instance_of(BufferPool))
+    capture: Optional[CaptureWriter] = field(
+        validator=validators.optional(validators.instance_of(CaptureWriter))
+    )
+    scheduler: TransmitScheduler = field(
+        validator=validators.instance_of(TransmitScheduler)
+    )
+    pacer: Optional[Pacer] = field(
+        validator=validators.optional(validators.instance_of(Pacer))
+    )
+    # the channel served by a connector facing the raw data, None for the connector
+    # facing the remote instance which transmits every channel
+    channel: Optional[int] = field(
+        validator=validators.optional(validators.instance_of(int))
+    )
+    # the held polls answered by the transmitter of a server mode instance
+    polls: Optional[PollQueue] = field(
+        validator=validators.optional(validators.instance_of(PollQueue))
+    )
+    # drops junk received by the connector facing the remote instance
+    packet_filter: Optional[PacketFilter] = field(
+        validator=validators.optional(validators.instance_of(PacketFilter))
+    )
 
-    def receive(self) -> Optional[tuple[bytes, tuple[str, int]]]:
+    def receive(
+        self, buffer: bytearray
+    ) -> Optional[tuple[memoryview, tuple[str, int]]]:
         """Listens for incoming connections and returns the message and source address
 
+        Args:
+            buffer: The buffer to receive the message into
+
         Returns:
-            The message and source address as a tuple or a (None, None) tuple if a
-            connection refused message is received
+            A view of the message within buffer and the source address as a tuple or
+            a (None, None) tuple if a connection refused message is received or no
+            message is waiting on the non-blocking socket
         """
         try:
-            data, address = self.sock.recvfrom(df.MAX_RECV_BUFFER)
+            length, address = self.sock.recvfrom_into(buffer)
+        except BlockingIOError:
+            return (None, None)
         except ConnectionRefusedError:
             logger.error(f"[{self.connector_type}] Connection refused (Errno 111)")
             return (None, None)
-        return data, address
+        return memoryview(buffer)[:length], address
 
-    def listener_service(self):
-        """Starts the listener service, this will write all incoming packets to
-        the respective folder inbound/raw_capture or outbound/raw_capture
+    def grab_packets(self) -> list[os.DirEntry]:
+        """Returns the packets waiting to be transmitted in the order chosen by the
+        scheduler
+
+        Returns:
+            The spooled packets to transmit during this pass
         """
-        logger.info(
-            f"[{self.connector_type}] Started response listener for {self.endpoint}:{self.port}"
-        )
-        while True:
-            packet_bytes, addr = self.receive()
-            # ignore if the receive command failed
-            if packet_bytes is None or addr is None:
-                continue
-
-            # print the updated server transmit endpoint
-            if self.tx_address != addr:
-                if self.tx_address is not None:
-                    logger.info(
-                        f"[{self.connector_type}] transmit endpoint is changing from "
-                        f"{self.tx_address[0]}:{self.tx_address[1]} to {addr[0]}:{addr[1]}"
-                    )
-                else:
-                    logger.info(
-                        f"[{self.connector_type}] initial transmit endpoint "
-                        f"is set to {addr[0]}:{addr[1]}"
+        with os.scandir(path=f"{df.CLIENT_DIR}/{self.tx_path}/") as entries:
+            packet_list = sorted(
+                (
+                    entry
+                    for entry in entries
+                    if entry.name.endswith(".bin")
+                    and (
+                        self.channel is None or get_channel(entry.name) == self.channel
                     )
-            self.tx_address = addr
-            date_string = df.get_datetime()
-            logger.info(
-                f"[{self.connector_type}] Received {len(packet_bytes)} byte packet from "
-                f"{addr[0]}:{addr[1]} writing binary to {self.recv_path}/{date_string}.bin"
+                ),
+                key=lambda entry: entry.name,
+            )
+        return self.scheduler.schedule(packet_list)
+
+    def read_packet(self, path: str) -> tuple[bytearray, memoryview]:
+        """Reads a spooled packet into a pooled buffer
+
+        Args:
+            path: Path to the binary file
+
+        Returns:
+            The buffer (to be released back to the pool) and a view of the packet
+        """
+        return self.pool.read_file(path=path)
+
+    def update_tx_address(self, addr: tuple[str, int]):
+        """Stores the source address of a received packet as the transmit endpoint
+
+        Args:
+            addr: The source address of the received packet
+        """
+        # print the updated server transmit endpoint
+        if self.tx_address != addr:
+            if self.tx_address is not None:
+                logger.info(
+                    f"[{self.connector_type}] transmit endpoint is changing from "
+                    f"{self.tx_address[0]}:{self.tx_address[1]} to {addr[0]}:{addr[1]}"
+                )
+            else:
+                logger.info(
+                    f"[{self.connector_type}] initial transmit endpoint "
+                    f"is set to {addr[0]}:{addr[1]}"
+                )
+        self.tx_address = addr
+        if self.polls is not None:
+            self.polls.add(addr)
+
+    def idle(self, counter: TrafficCounter):
+        """Flushes the traffic summaries of the listener while no packets arrive
+
+        Args:
+            counter: The traffic counter of the listener
+        """
+        counter.idle()
+        if self.packet_filter is not None:
+            self.packet_filter.counter.idle()
+
+    def accept_packet(
+        self, packet_bytes: memoryview, addr: tuple[str, int]
+    ) -> Optional[memoryview]:
+        """Drops junk before it can change the transmit endpoint or reach the spool
+        and stores the source address of a packet that passed
+
+        Args:
+            packet_bytes: The received packet
+            addr: The source address of the packet
+
+        Returns:
+            The packet or None if the packet filter dropped it
+        """
+        if self.packet_filter is not None:
+            packet_bytes = self.packet_filter.check(packet=packet_bytes, address=addr)
+            if packet_bytes is None:
+                return None
+        self.update_tx_address(addr)
+        return packet_bytes
+
+    def spool_packet(self, packet_bytes: memoryview, addr: tuple[str, int]):
+        """Writes a received packet to the respective folder inbound/raw_capture or
+        outbound/raw_capture
+
+        Args:
+            packet_bytes: The received packet
+            addr: The source address of the packet
+        """
+        # tag the packet with its channel and flow for the converter and scheduler
+        packet_name = f"{df.get_datetime()}_{self.channel or 0}-{addr[0]}-{addr[1]}.bin"
+        # per packet messages are only formatted when DEBUG is enabled
+        logger.debug(
+            "[{}] Received {} byte packet from {}:{} writing binary to {}/{}",
+            self.connector_type,
+            len(packet_bytes),
+            addr[0],
+            addr[1],
+            self.recv_path,
+            packet_name,
+        )
+        df.write_packet_file(
+            path=f"{df.CLIENT_DIR}/{self.recv_path}/{packet_name}",
+            packet=packet_bytes,
+        )
+
+    def relay_packet(
+        self,
+        packet_bytes: memoryview,
+        addr: tuple[str, int],
+        destination: "ClientConnector | ServerConnector",
+    ):
+        """Forwards a received packet straight to the destination connector instead of
+        writing it to the spool. Only used when the packet converter would not change
+        the packet, I.E: protocol and encoding none without framing
+
+        Args:
+            packet_bytes: The received packet
+            addr: The source address of the packet
+            destination: The client or server connector that transmits the packet
+        """
+        logger.debug(
+            "[{}] Relaying {} byte packet from {}:{}",
+            self.connector_type,
+            len(packet_bytes),
+            addr[0],
+            addr[1],
+        )
+        destination.forward(data=packet_bytes)
+
+    def get_address(self) -> Optional[tuple[str, int]]:
+        """Returns the address the next packet is transmitted to
+
+        Raises:
+            NotImplementedError: Implemented by the client and server connector
+
+        Returns:
+            The address or None if the packet has to wait
+        """
+        raise NotImplementedError
+
+    def transmit(self, data: bytes | memoryview, address: tuple[str, int]):
+        """Sends a packet whose pacer tokens have already been taken
+
+        Args:
+            data: The packet to transmit
+            address: The address returned by get_address
+
+        Raises:
+            NotImplementedError: Implemented by the client and server connector
+        """
+        raise NotImplementedError
+
+    def forward(self, data: bytes | memoryview):
+        """Transmits a packet received by the other connector without spooling it,
+        packets are dropped until an address is known
+
+        Args:
+            data: The packet to transmit
+        """
+        if (address := self.get_address()) is None:
+            logger.debug(
+                "[{}] Dropping {} byte packet, no transmit endpoint yet",
+                self.connector_type,
+                len(data),
+            )
+            return
+        if self.pacer is not None:
+            self.pacer.wait(size=len(data))
+        self.transmit(data=data, address=address)
+
+    def transmit_pending(
+        self, limit: int, counter: TrafficCounter
+    ) -> tuple[int, float]:
+        """Transmits up to limit spooled packets in the order chosen by the scheduler,
+        stops early instead of sleeping when the pacer or a missing address holds the
+        next packet back
+
+        Args:
+            limit: The maximum number of packets to transmit
+            counter: The traffic counter of the transmitter
+
+        Returns:
+            The number of packets transmitted and the seconds until the pacer lets the
+                next packet go, 0 if the pacer is not holding a packet back
+        """
+        transmitted = 0
+        for packet in self.grab_packets()[:limit]:
+            if self.pacer is not None and (delay := self.pacer.delay()) > 0:
+                return transmitted, delay
+            # I.E: no transmit endpoint yet or the packet waits for a poll
+            if (address := self.get_address()) is None:
+                return transmitted, 0.0
+            packet_path = packet.path
+            buffer, packet_bytes = self.read_packet(path=packet_path)
+
+            logger.debug(
+                "[{}] Transmitting {} byte packet {}/{} to {}:{}",
+                self.connector_type,
+                len(packet_bytes),
+                self.tx_path,
+                packet.name,
+                address[0],
+                address[1],
+            )
+            logger.opt(lazy=True).trace(
+                "[{}] {}",
+                lambda: self.connector_type,
+                lambda: packet_bytes.tobytes(),
             )
-            with open(
-                file=f"{df.CLIENT_DIR}/{self.recv_path}/{date_string}.bin", mode="wb"
-            ) as file:
-                file.write(packet_bytes)
+            counter.add(len(packet_bytes))
+            if self.pacer is not None:
+                self.pacer.consume(size=len(packet_bytes))
+            self.transmit(data=packet_bytes, address=address)
+            self.pool.release(buffer)
+            try:
+                os.remove(packet_path)
+            except PermissionError:
+                logger.error(
+                    f"[{self.connector_type}] Permission denied when attempting to delete {packet_path}"
+                )
+            transmitted += 1
+        return transmitted, 0.0
@@ -0,0 +1,56 @@
+"""Pool of reusable byte buffers for receiving and reading packets"""
+
+# Standard libraries
+import os
+from collections import deque
+
+# Project libraries
+import src.default as df
+
+
+class BufferPool:
+    """Defines the BufferPool class which hands out preallocated bytearrays so packets
+    can be received and read with recv_into/readinto instead of allocating new bytes
+    objects for every packet"""
+
+    def __init__(self, buffer_size: int = df.MAX_RECV_BUFFER, max_buffers: int = 8):
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self.buffers: deque[bytearray] = deque()
+
+    def acquire(self) -> bytearray:
+        """Returns a free buffer from the pool or allocates a new one if the pool is empty
+
+        Returns:
+            A bytearray of buffer_size bytes
+        """
+        try:
+            return self.buffers.pop()
+        except IndexError:
+            return bytearray(self.buffer_size)
+
+    def release(self, buffer: bytearray):
+        """Returns a buffer to the pool, surplus buffers are left to the garbage collector
+
+        Args:
+            buffer: The buffer previously returned by acquire
+        """
+        if len(self.buffers) < self.max_buffers:
+            self.buffers.append(buffer)
+
+    def read_file(self, path: str) -> tuple[bytearray, memoryview]:
+        """Reads a file into a pooled buffer
+
+        Args:
+            path: Path to the file to read
+
+        Returns:
+            The buffer (to be released by the caller) and a memoryview of the file contents
+        """
+        buffer = self.acquire()
+        with open(file=path, mode="rb", buffering=0) as file:
+            size = os.fstat(file.fileno()).st_size
+            if size > len(buffer):
+                buffer = bytearray(size)
+            read_length = file.readinto(buffer)
+        return buffer, memoryview(buffer)[:read_length]
@@ -1,7 +1,6 @@
 """Connector class for transmitting data to the server node"""
 
 # Standard libraries
-import os
 import socket
 from typing import Optional
 
@@ -10,9 +9,11 @@ from attrs import define
 from loguru import logger
 
 # Project libraries
-import src.default as df
-from src.base_connector import BaseConnector
+from src.base_connector import BaseConnector, DatagramSocket
+from src.buffer_pool import BufferPool
 from src.load_config import ClientConfig
+from src.pacer import create_pacer
+from src.scheduler import TransmitScheduler
 
 
 @define
@@ -20,23 +21,47 @@ class ClientConnector(BaseConnector):
     """Defines the ClientConnector class for connecting to a ServerConnector object
     or another server I.E: OpenVPN server"""
 
-    def __init__(self, config: ClientConfig):
+    def __init__(
+        self,
+        config: ClientConfig,
+        sock: Optional[DatagramSocket] = None,
+        channel: Optional[int] = None,
+    ):
         self.connector_type = "client"
         self.endpoint = config.endpoint
         self.port = config.port
         self.tx_path = config.tx_path
         self.recv_path = config.recv_path
         self.tx_address = None
+        self.pool = BufferPool()
+        self.capture = None
+        self.channel = channel
+        self.polls = None
+        self.packet_filter = None
+        self.scheduler = TransmitScheduler(
+            mode=config.scheduler,
+            quantum=config.quantum,
+            priority_size=config.priority_size,
+        )
+        self.pacer = create_pacer(
+            packet_rate=config.packet_rate,
+            byte_rate=config.byte_rate,
+            burst=config.burst,
+            adaptive=config.adaptive_pacing,
+            name=self.connector_type,
+        )
 
-        # Create the socket
-        self.sock = socket.socket(
+        # Create the socket unless one is provided I.E: by the network simulator
+        self.sock = sock or socket.socket(
             family=socket.AddressFamily.AF_INET, type=socket.SOCK_DGRAM
         )
+        # the shared listener only receives once the selector reports a datagram
+        self.sock.settimeout(0)
 
         # Attempt to connect to a remote host
         self.sock.connect((self.endpoint, self.port))
 
-    def send(self, data: bytes) -> Optional[int]:
+    def send(self, data: bytes | memoryview) -> Optional[int]:
         """Transmits a byte string to the socket endpoint and port
 
         Args:
@@ -51,33 +76,31 @@ class ClientConnector(BaseConnector):
             logger.error(
                 f"[{self.connector_type}] Connection refused by {self.endpoint}:{self.port}"
             )
+        except BlockingIOError:
+            logger.error(f"[{self.connector_type}] Send buffer full, packet dropped")
         return None
 
-    def transmit_service(self):
-        """Starts the transmit service, this will send all
-        processed packets to the specified endpoint and port
+    def get_address(self) -> tuple[str, int]:
+        """Returns the address the next packet is transmitted to
+
+        Returns:
+            The endpoint and port the socket is connected to
         """
-        logger.info(
-            f"[{self.connector_type}] Started transmitter to {self.endpoint}:{self.port}"
-        )
-        while True:
-            # grab a list of all packets and sort them oldest to newest
-            packet_list = os.listdir(path=f"{df.CLIENT_DIR}/{self.tx_path}/")
-            packet_list.sort()
-            for packet in packet_list:
-                packet_path = f"{df.CLIENT_DIR}/{self.tx_path}/{packet}"
-                with open(file=packet_path, mode="rb") as file:
-                    packet_bytes = file.read()
+        return (self.endpoint, self.port)
 
-                logger.info(
-                    f"[{self.connector_type}] Transmitting {len(packet_bytes)} byte packet "
-                    f"{self.tx_path}/{packet} to {self.endpoint}:{self.port}"
-                )
-                logger.trace(f"[{self.connector_type}] {packet_bytes}")
-                self.send(data=packet_bytes)
-                try:
-                    os.remove(packet_path)
-                except PermissionError:
-                    logger.error(
-                        f"[{self.connector_type}] Permission denied when attempting to delete {packet_path}"
-                    )
+    def transmit(self, data: bytes | memoryview, address: tuple[str, int]):
+        """Sends a packet whose pacer tokens have already been taken
+
+        Args:
+            data: The packet to transmit
+            address: The address returned by get_address, the socket is connected
+        """
+        transmitted = self.send(data=data)
+        if self.pacer is not None:
+            self.pacer.report(sent=1, lost=int(transmitted is None))
+        if self.capture is not None:
+            self.capture.write(
+                payload=data,
+                source=self.sock.getsockname(),
+                destination=self.sock.getpeername(),
+            )
@@ -10,6 +10,16 @@ CLIENT_DIR = "/".join(
 MAX_RECV_BUFFER = 65535
 PROTOCOLS = ["dns", "none"]
 ENCODING = ["base64", "base85", "none"]
+DEFAULT_EDNS_SIZE = 1232
+SCHEDULER_MODES = ["fifo", "priority", "drr"]
+DEFAULT_SCHEDULER_QUANTUM = 1500
+DEFAULT_PRIORITY_SIZE = 256
+DEFAULT_BURST = 0.05
+DEFAULT_POLL_INTERVAL = 0.05
+DEFAULT_POLL_MAX_INTERVAL = 1.0
+DEFAULT_POLL_TIMEOUT = 2.0
+DEFAULT_FILTER_BURST = 1.0
+LISTEN_TIMEOUT = 0.5  # seconds a shared service waits for work before idle work
 INBOUND_RAW_PATH = "inbound/raw_capture"
 INBOUND_PROCESSED_PATH = "inbound/disassembled_packets"
 OUTBOUND_RAW_PATH = "outbound/raw_capture"
@@ -20,6 +30,21 @@ DIRECTORY_PATHS = [
     OUTBOUND_RAW_PATH,
     OUTBOUND_PROCESSED_PATH,
 ]
+TUNNELS_PATH = "tunnels"
+
+
+def get_spool_path(spool_dir: str, path: str) -> str:
+    """returns the path of a spool directory relative to CLIENT_DIR
+    I.E: ("tunnels/vpn", "inbound/raw_capture") becomes "tunnels/vpn/inbound/raw_capture"
+
+    Args:
+        spool_dir: The spool directory of the tunnel, "" for the single tunnel layout
+        path: One of the DIRECTORY_PATHS
+
+    Returns:
+        The combined path
+    """
+    return f"{spool_dir}/{path}" if spool_dir else path
 
 
 def get_datetime() -> str:
@@ -27,3 +52,17 @@ def get_datetime() -> str:
     <year><month><day><hour><minute><second><millisecond>
     I.E: 20250620100000472991"""
     return datetime.now().strftime(r"%Y%m%d%H%M%S%f")
+
+
+def write_packet_file(path: str, packet: bytes | memoryview):
+    """Writes a packet to a temporary file and renames it into place, so services
+    polling the directory never read a partially written packet
+
+    Args:
+        path: Path to the desired .bin file
+        packet: The byte string to write
+    """
+    temp_path = f"{path}.tmp"
+    with open(file=temp_path, mode="wb") as file:
+        file.write(packet)
+    os.replace(temp_path, path)
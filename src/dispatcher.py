@@ -0,0 +1,446 @@
+"""Runs the listener, assembler, disassembler and transmitter shared by every tunnel of
+the process, each service serves the sockets or spools of all tunnels from one thread"""
+
+# Standard libraries
+import heapq
+import itertools
+import selectors
+import threading
+import time
+import traceback
+from typing import Callable, Optional, TypeVar
+
+# Third-party libraries
+from attrs import define, field, validators
+from loguru import logger
+
+# Project libraries
+import src.default as df
+from src.base_connector import BaseConnector
+from src.packet_converter import PacketConverter
+from src.traffic_stats import TrafficCounter
+
+PASS_SIZE = 256  # packets a service handles for one connector before the next one
+
+Result = TypeVar("Result")
+
+
+class WorkSignal:
+    """Defines the WorkSignal class which wakes a shared service once a packet has been
+    queued for it, the service still checks its spools every LISTEN_TIMEOUT seconds"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        # packets left in the spools by a previous process are handled straight away
+        self.event.set()
+
+    def notify(self):
+        """Wakes the service waiting on the signal"""
+        self.event.set()
+
+    def wait(self, timeout: float):
+        """Blocks until the signal is notified or timeout has elapsed
+
+        Args:
+            timeout: The maximum number of seconds to wait
+        """
+        self.event.wait(timeout=timeout)
+        # the spools are checked after clearing, a packet queued in the meantime
+        # notifies the signal again
+        self.event.clear()
+
+
+class ServiceGate:
+    """Defines the ServiceGate class which stops a shared service between two passes,
+    I.E: during a handoff. The service sets paused once the packets of its pass in
+    flight have been written or sent"""
+
+    def __init__(self):
+        self.running = threading.Event()
+        self.running.set()
+        self.paused = threading.Event()
+
+    def pause(self, timeout: float, signal: Optional[WorkSignal] = None) -> bool:
+        """Stops the service before its next pass
+
+        Args:
+            timeout: The maximum number of seconds to wait for the service to stop
+            signal: Wakes the service if it is waiting for work
+
+        Returns:
+            True if the service stopped within timeout
+        """
+        self.paused.clear()
+        self.running.clear()
+        if signal is not None:
+            signal.notify()
+        return self.paused.wait(timeout=timeout)
+
+    def resume(self):
+        """Restarts the service after pause"""
+        self.running.set()
+
+    def hold(self) -> bool:
+        """Blocks the service while it is paused
+
+        Returns:
+            True if the service was paused
+        """
+        if self.running.is_set():
+            return False
+        self.paused.set()
+        self.running.wait()
+        return True
+
+
+@define
+class Route:
+    """Defines the Route class which holds the state the shared services keep for a
+    connector of a tunnel"""
+
+    connector: BaseConnector = field(validator=validators.instance_of(BaseConnector))
+    log_name: str = field(validator=validators.instance_of(str))
+    # the connector transmitting the received packets of a relay, None if the
+    # received packets are spooled
+    destination: Optional[BaseConnector] = field(
+        validator=validators.optional(validators.instance_of(BaseConnector))
+    )
+    received: TrafficCounter = field(validator=validators.instance_of(TrafficCounter))
+    transmitted: TrafficCounter = field(
+        validator=validators.instance_of(TrafficCounter)
+    )
+    # time.monotonic() value before which the pacer holds the next spooled packet
+    ready_at: float = field(default=0.0)
+
+
+class Dispatcher:
+    """Defines the Dispatcher class which serves the connectors and packet converters
+    of every tunnel with four threads, no matter how many tunnels are configured. The
+    listener waits on a selector over all sockets and the other services wait on a
+    WorkSignal instead of polling their spools. Each service handles at most PASS_SIZE
+    packets per connector or converter before moving on, so a busy tunnel cannot starve
+    the others"""
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.routes: list[Route] = []
+        self.converters: list[tuple[str, PacketConverter]] = []
+        self.assemble = WorkSignal()
+        self.disassemble = WorkSignal()
+        self.transmit = WorkSignal()
+        # every packet is handled before the next receive, one buffer is enough
+        self.buffer = bytearray(df.MAX_RECV_BUFFER)
+        # relays whose destination pacer is holding packets back, re-registered with
+        # the selector once the pacer allows the next packet
+        self.deferred: list[tuple[float, int, Route]] = []
+        self.sequence = itertools.count()
+        # stop the services between two passes, I.E: during a handoff
+        self.gates = {
+            name: ServiceGate()
+            for name in ("listener", "assembler", "disassembler", "transmitter")
+        }
+
+    def add_tunnel(
+        self,
+        log_name: str,
+        connectors: list[BaseConnector],
+        packet: Optional[PacketConverter] = None,
+        relay: Optional[tuple[BaseConnector, BaseConnector]] = None,
+    ):
+        """Adds the connectors and packet converter of a tunnel to the shared services,
+        must be called before the services are started
+
+        Args:
+            log_name: Prefix added to the tunnel's log messages
+            connectors: The connectors of the tunnel
+            packet: The packet converter of the tunnel, None for a relay
+            relay: Two connectors that forward their received packets to each other
+                instead of spooling them
+        """
+        destinations = {}
+        if relay is not None:
+            destinations = {id(relay[0]): relay[1], id(relay[1]): relay[0]}
+        with logger.contextualize(tunnel=log_name):
+            for connector in connectors:
+                destination = destinations.get(id(connector))
+                route = Route(
+                    connector=connector,
+                    log_name=log_name,
+                    destination=destination,
+                    received=TrafficCounter(
+                        name=connector.connector_type,
+                        action="Received" if destination is None else "Relayed",
+                    ),
+                    transmitted=TrafficCounter(
+                        name=connector.connector_type, action="Transmitted"
+                    ),
+                )
+                self.routes.append(route)
+                self.selector.register(connector.sock, selectors.EVENT_READ, route)
+                logger.info(
+                    f"[{connector.connector_type}] Listening on "
+                    f"{connector.endpoint}:{connector.port}"
+                )
+            if packet is not None:
+                packet.on_inject = self.transmit.notify
+                self.converters.append((log_name, packet))
+                logger.info(
+                    f"[assembler] Converting {packet.assemble_source} -> "
+                    f"{packet.assemble_destination} and {packet.disassemble_source} "
+                    f"-> {packet.disassemble_destination}"
+                )
+
+    def services(self) -> list[tuple[Callable[[], None], str]]:
+        """Returns the shared services with their names
+
+        Returns:
+            The services to run, each on its own thread
+        """
+        return [
+            (self.listener_service, "listener"),
+            (self.assembler_service, "assembler"),
+            (self.disassembler_service, "disassembler"),
+            (self.transmitter_service, "transmitter"),
+        ]
+
+    def serve(
+        self, log_name: str, name: str, work: Callable[[], Result], default: Result
+    ) -> Result:
+        """Runs the work of one tunnel, a crash is logged without stopping the shared
+        service for the other tunnels
+
+        Args:
+            log_name: Prefix added to the tunnel's log messages
+            name: Name of the service (for logging only)
+            work: The work to run
+            default: Returned if the work crashed
+
+        Returns:
+            The result of the work or default
+        """
+        with logger.contextualize(tunnel=log_name):
+            try:
+                return work()
+            except Exception as e:
+                logger.error(f"[{name}] Crashed: {e}\n{traceback.format_exc()}")
+                return default
+
+    def pause_services(self, timeout: float) -> bool:
+        """Stops the listener and then the services downstream of it once their
+        packets in flight have been spooled or sent, packets that arrive in the
+        meantime wait in the socket buffers and spooled packets stay on disk
+
+        Args:
+            timeout: The maximum number of seconds to wait for each service to stop
+
+        Returns:
+            True if every service stopped within timeout
+        """
+        signals = {
+            "assembler": self.assemble,
+            "disassembler": self.disassemble,
+            "transmitter": self.transmit,
+        }
+        return all(
+            gate.pause(timeout=timeout, signal=signals.get(name))
+            for name, gate in self.gates.items()
+        )
+
+    def resume_services(self):
+        """Restarts the services after pause_services"""
+        for gate in self.gates.values():
+            gate.resume()
+
+    def receive_pending(self, route: Route) -> float:
+        """Receives up to PASS_SIZE packets waiting on the socket of a connector and
+        spools or relays them
+
+        Args:
+            route: The route of the connector
+
+        Returns:
+            The seconds until the destination pacer of a relay lets the next packet
+                go, 0 if the pacer is not holding a packet back
+        """
+        connector = route.connector
+        destination = route.destination
+        had_address = connector.tx_address is not None
+        spooled = 0
+        for _ in range(PASS_SIZE):
+            # leave the packets in the socket buffer instead of sleeping in the pacer
+            if (
+                destination is not None
+                and destination.pacer is not None
+                and (delay := destination.pacer.delay()) > 0
+            ):
+                return delay
+            packet_bytes, addr = connector.receive(buffer=self.buffer)
+            # stop once the socket is drained or the receive command failed
+            if packet_bytes is None or addr is None:
+                break
+            if (packet_bytes := connector.accept_packet(packet_bytes, addr)) is None:
+                continue
+            route.received.add(len(packet_bytes))
+            if destination is not None:
+                connector.relay_packet(packet_bytes, addr, destination=destination)
+            else:
+                connector.spool_packet(packet_bytes, addr)
+                spooled += 1
+
+        if spooled > 0:
+            # the connector facing the remote instance spools assembled packets
+            if connector.channel is None:
+                self.disassemble.notify()
+            else:
+                self.assemble.notify()
+        # a new poll or transmit endpoint lets held packets go
+        if spooled > 0 and (connector.polls is not None or not had_address):
+            self.transmit.notify()
+        return 0.0
+
+    def listener_service(self):
+        """Starts the listener service, this waits for packets on the sockets of every
+        tunnel and writes them to the respective folder inbound/raw_capture or
+        outbound/raw_capture or relays them
+        """
+        logger.info(f"[listener] Started listener for {len(self.routes)} connectors")
+        last_idle = time.monotonic()
+        gate = self.gates["listener"]
+        while True:
+            if gate.hold():
+                continue
+            now = time.monotonic()
+            while self.deferred and self.deferred[0][0] <= now:
+                _, _, route = heapq.heappop(self.deferred)
+                self.selector.register(
+                    route.connector.sock, selectors.EVENT_READ, route
+                )
+            timeout = df.LISTEN_TIMEOUT
+            if self.deferred:
+                timeout = min(timeout, self.deferred[0][0] - now)
+
+            for key, _ in self.selector.select(timeout=timeout):
+                route = key.data
+                delay = self.serve(
+                    route.log_name,
+                    f"{route.connector.connector_type}-listener",
+                    lambda: self.receive_pending(route),
+                    0.0,
+                )
+                if delay > 0:
+                    self.selector.unregister(route.connector.sock)
+                    heapq.heappush(
+                        self.deferred, (now + delay, next(self.sequence), route)
+                    )
+
+            # flush the traffic summaries of the quiet connectors
+            if (now := time.monotonic()) - last_idle >= df.LISTEN_TIMEOUT:
+                last_idle = now
+                for route in self.routes:
+                    with logger.contextualize(tunnel=route.log_name):
+                        route.connector.idle(route.received)
+                        if (
+                            route.destination is not None
+                            and route.destination.capture is not None
+                        ):
+                            route.destination.capture.idle()
+
+    def converter_service(
+        self,
+        name: str,
+        signal: WorkSignal,
+        convert: Callable[[PacketConverter, int], int],
+    ):
+        """Runs the assembler or disassembler for the packet converter of every tunnel
+
+        Args:
+            name: Name of the service (for logging only)
+            signal: Notified once packets have been spooled for the service
+            convert: Converts up to the given number of spooled packets and returns
+                how many were converted
+        """
+        logger.info(f"[{name}] Started {name} for {len(self.converters)} tunnels")
+        gate = self.gates[name]
+        last_idle = time.monotonic()
+        while True:
+            if gate.hold():
+                continue
+            busy = False
+            for log_name, packet in self.converters:
+                converted = self.serve(
+                    log_name, name, lambda: convert(packet, PASS_SIZE), 0
+                )
+                if converted > 0:
+                    self.transmit.notify()
+                busy |= converted == PASS_SIZE
+            # packets are left in a spool once PASS_SIZE were converted
+            if not busy:
+                signal.wait(timeout=df.LISTEN_TIMEOUT)
+            # flush the traffic summaries of the quiet converters
+            if (now := time.monotonic()) - last_idle >= df.LISTEN_TIMEOUT:
+                last_idle = now
+                for log_name, packet in self.converters:
+                    with logger.contextualize(tunnel=log_name):
+                        packet.idle()
+
+    def assembler_service(self):
+        """Starts the assemble packets service, this takes packets from raw_capture and
+        builds them into assembled DNS packets in assembled_packets
+        """
+        self.converter_service(
+            name="assembler",
+            signal=self.assemble,
+            convert=PacketConverter.assemble_pending,
+        )
+
+    def disassembler_service(self):
+        """Starts the packet disassembly service, this takes assembled DNS packets from
+        inbound/raw_capture and dissects the data into inbound/disassembled_packets
+        """
+        self.converter_service(
+            name="disassembler",
+            signal=self.disassemble,
+            convert=PacketConverter.disassemble_pending,
+        )
+
+    def transmitter_service(self):
+        """Starts the transmit service, this sends the spooled packets of every
+        connector of every tunnel that is not a relay
+        """
+        routes = [route for route in self.routes if route.destination is None]
+        logger.info(f"[transmitter] Started transmitter for {len(routes)} connectors")
+        gate = self.gates["transmitter"]
+        last_idle = time.monotonic()
+        while True:
+            if gate.hold():
+                continue
+            now = time.monotonic()
+            busy = False
+            next_ready = now + df.LISTEN_TIMEOUT
+            for route in routes:
+                if route.ready_at > now:
+                    next_ready = min(next_ready, route.ready_at)
+                    continue
+                transmitted, delay = self.serve(
+                    route.log_name,
+                    f"{route.connector.connector_type}-transmitter",
+                    lambda: route.connector.transmit_pending(
+                        limit=PASS_SIZE, counter=route.transmitted
+                    ),
+                    (0, 0.0),
+                )
+                busy |= transmitted == PASS_SIZE
+                if delay > 0:
+                    route.ready_at = now + delay
+                    next_ready = min(next_ready, route.ready_at)
+            # packets are left in a spool once PASS_SIZE were transmitted
+            if not busy:
+                self.transmit.wait(timeout=max(next_ready - time.monotonic(), 0))
+            # flush the traffic summaries of the quiet transmitters
+            if (now := time.monotonic()) - last_idle >= df.LISTEN_TIMEOUT:
+                last_idle = now
+                for route in routes:
+                    with logger.contextualize(tunnel=route.log_name):
+                        route.transmitted.idle()
+                        if route.connector.capture is not None:
+                            route.connector.capture.idle()
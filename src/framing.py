@@ -0,0 +1,115 @@
+"""Optional tunnel framing placed in front of the data before it is encoded, used when
+both ends of the tunnel are Tunnel over Anything instances"""
+
+# Standard libraries
+from typing import Optional
+
+FRAME_DATA = 0
+FRAME_PROBE = 1
+FRAME_PROBE_REPLY = 2
+FRAME_CHANNEL_DATA = 3  # data of a multiplexed channel, prefixed by the channel id
+FRAME_POLL = 4  # empty frame the server mode instance can answer with downstream data
+FRAME_TYPES = (
+    FRAME_DATA,
+    FRAME_PROBE,
+    FRAME_PROBE_REPLY,
+    FRAME_CHANNEL_DATA,
+    FRAME_POLL,
+)
+HEADER_LENGTH = 1
+CHANNEL_LENGTH = 2
+
+
+def build_frame(frame_type: int, payload: bytes | memoryview) -> bytes:
+    """Prefixes a payload with the frame header
+
+    Args:
+        frame_type: One of FRAME_TYPES
+        payload: The frame payload
+
+    Returns:
+        The frame as a byte string
+    """
+    return b"".join([frame_type.to_bytes(length=1, byteorder="big"), payload])
+
+
+def parse_frame(
+    frame: bytes | memoryview,
+) -> tuple[Optional[int], Optional[bytes | memoryview]]:
+    """Splits a frame into its type and payload
+
+    Args:
+        frame: The frame built by build_frame
+
+    Returns:
+        The frame type and payload as a tuple or a (None, None) tuple if the
+        frame is malformed
+    """
+    if len(frame) < HEADER_LENGTH or frame[0] not in FRAME_TYPES:
+        return (None, None)
+    return frame[0], frame[HEADER_LENGTH:]
+
+
+def build_data_frame(channel: int, data: bytes | memoryview) -> bytes:
+    """Frames data of a channel, channel 0 uses the plain data frame
+
+    Args:
+        channel: The channel id
+        data: The data to frame
+
+    Returns:
+        The frame as a byte string
+    """
+    if channel == 0:
+        return build_frame(FRAME_DATA, data)
+    return b"".join(
+        [
+            FRAME_CHANNEL_DATA.to_bytes(length=1, byteorder="big"),
+            channel.to_bytes(length=CHANNEL_LENGTH, byteorder="big"),
+            data,
+        ]
+    )
+
+
+def pack_data_frame(
+    buffer: bytearray, channel: int, data: bytes | memoryview
+) -> bytearray:
+    """Frames data of a channel like build_data_frame but reuses buffer instead of
+    allocating a new byte string, the frame is only valid until buffer is reused
+
+    Args:
+        buffer: The scratch buffer to build the frame in
+        channel: The channel id
+        data: The data to frame
+
+    Returns:
+        buffer holding the frame
+    """
+    buffer.clear()
+    if channel == 0:
+        buffer.append(FRAME_DATA)
+    else:
+        buffer.append(FRAME_CHANNEL_DATA)
+        buffer += channel.to_bytes(length=CHANNEL_LENGTH, byteorder="big")
+    buffer += data
+    return buffer
+
+
+def parse_channel_data(
+    payload: bytes | memoryview,
+) -> tuple[Optional[int], Optional[bytes | memoryview]]:
+    """Splits the payload of a channel data frame into the channel id and data
+
+    Args:
+        payload: The payload returned by parse_frame for a FRAME_CHANNEL_DATA frame
+
+    Returns:
+        The channel id and data as a tuple or a (None, None) tuple if the payload
+        is malformed
+    """
+    if len(payload) < CHANNEL_LENGTH:
+        return (None, None)
+    return (
+        int.from_bytes(payload[:CHANNEL_LENGTH], byteorder="big"),
+        payload[CHANNEL_LENGTH:],
+    )
@@ -0,0 +1,183 @@
+"""Hands the connector sockets and their session state over to a newly started
+tunnel_over_anything process through a UNIX socket so restarts do not drop traffic"""
+
+# Standard libraries
+import json
+import os
+import socket
+from typing import Optional
+
+# Third-party libraries
+from attrs import define, field, validators
+from loguru import logger
+
+# Project libraries
+import src.default as df
+from src.base_connector import BaseConnector
+from src.dispatcher import Dispatcher
+
+HEADER_LENGTH = 4  # length prefix of the JSON state message
+MAX_HANDOFF_SIZE = 65535
+MAX_HANDOFF_SOCKETS = 253  # SCM_MAX_FD
+ACKNOWLEDGEMENT = b"ok"
+PAUSE_TIMEOUT = 4 * df.LISTEN_TIMEOUT  # seconds to wait for each service to stop
+
+
+@define
+class HandedSocket:
+    """Defines the HandedSocket class which holds a socket received from the previous
+    process and the session state of the connector that owned it"""
+
+    sock: socket.socket = field(validator=validators.instance_of(socket.socket))
+    tx_address: Optional[tuple[str, int]] = field()
+    polls: list[tuple[str, int]] = field(factory=list)
+
+
+def request_handoff(path: str) -> dict[str, HandedSocket]:
+    """Takes the sockets over from the process serving handoffs at path, blocks until
+    that process has exited
+
+    Args:
+        path: Path of the UNIX socket the previous process listens on
+
+    Returns:
+        The handed sockets keyed by "<tunnel name>/<connector>", empty if no process
+            is serving handoffs
+    """
+    conn = socket.socket(family=socket.AF_UNIX, type=socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        conn.close()
+        return {}
+
+    with conn:
+        message, fds, _, _ = socket.recv_fds(
+            conn, MAX_HANDOFF_SIZE, MAX_HANDOFF_SOCKETS
+        )
+        if not message:
+            raise ConnectionError("Previous process refused the handoff")
+        length = int.from_bytes(message[:HEADER_LENGTH], byteorder="big")
+        while len(message) < HEADER_LENGTH + length:
+            if not (chunk := conn.recv(MAX_HANDOFF_SIZE)):
+                raise ConnectionError("Handoff state message was truncated")
+            message += chunk
+        states = json.loads(message[HEADER_LENGTH : HEADER_LENGTH + length])
+
+        handed = {}
+        for state, fd in zip(states, fds):
+            handed[state["name"]] = HandedSocket(
+                sock=socket.socket(fileno=fd),
+                tx_address=tuple(state["tx_address"]) if state["tx_address"] else None,
+                polls=[tuple(address) for address in state["polls"]],
+            )
+
+        # the previous process exits once the sockets are acknowledged, only start
+        # receiving after it has stopped
+        conn.sendall(ACKNOWLEDGEMENT)
+        while conn.recv(MAX_HANDOFF_SIZE):
+            continue
+    logger.info(f"[handoff] Took over {len(handed)} sockets from the previous process")
+    return handed
+
+
+class HandoffServer:
+    """Defines the HandoffServer class which waits for a new process to request the
+    connector sockets, stops the services, sends the sockets with their session state
+    and exits this process. Spooled packets are left on disk for the new process to
+    send and packets received after the listener stopped wait in the socket buffer"""
+
+    def __init__(
+        self, path: str, connectors: dict[str, BaseConnector], dispatcher: Dispatcher
+    ):
+        self.path = path
+        self.connectors = connectors
+        self.dispatcher = dispatcher
+
+    def get_states(self) -> list[dict]:
+        """Returns the session state of every connector
+
+        Returns:
+            The JSON serializable state of each connector in the order of connectors
+        """
+        states = []
+        for name, connector in self.connectors.items():
+            polls = []
+            if connector.polls is not None:
+                with connector.polls.lock:
+                    polls = [address for _, address in connector.polls.polls]
+            states.append(
+                {"name": name, "tx_address": connector.tx_address, "polls": polls}
+            )
+        return states
+
+    def pause_services(self) -> bool:
+        """Stops the shared listener, converters and transmitter once the packets in
+        flight are spooled or sent
+
+        Returns:
+            True if every service stopped within PAUSE_TIMEOUT
+        """
+        return self.dispatcher.pause_services(timeout=PAUSE_TIMEOUT)
+
+    def resume_services(self):
+        """Restarts the services after a failed handoff"""
+        self.dispatcher.resume_services()
+
+    def hand_over(self, conn: socket.socket) -> bool:
+        """Sends the sockets and their state to a new process
+
+        Args:
+            conn: The connection from the new process
+
+        Returns:
+            True if the new process acknowledged the sockets
+        """
+        message = json.dumps(self.get_states()).encode()
+        socket.send_fds(
+            conn,
+            [len(message).to_bytes(length=HEADER_LENGTH, byteorder="big"), message],
+            [connector.sock.fileno() for connector in self.connectors.values()],
+        )
+        return conn.recv(len(ACKNOWLEDGEMENT)) == ACKNOWLEDGEMENT
+
+    def handoff_service(self):
+        """Starts the handoff service, this listens on the UNIX socket at path and
+        exits the process once a new process has taken the sockets over. Closing a
+        connection without sending the sockets tells the new process the handoff was
+        refused
+        """
+        # a stale socket file is left behind if the previous process was killed
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        listener = socket.socket(family=socket.AF_UNIX, type=socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(1)
+        logger.info(f"[handoff] Listening for handoff requests on {self.path}")
+        while True:
+            conn, _ = listener.accept()
+            with conn:
+                # no packet may be received or sent by this process once the sockets
+                # are sent
+                if not self.pause_services():
+                    logger.error("[handoff] Services did not stop, refusing handoff")
+                    self.resume_services()
+                    continue
+                try:
+                    acknowledged = self.hand_over(conn)
+                except OSError as e:
+                    logger.error(f"[handoff] Handoff failed: {e}")
+                    self.resume_services()
+                    continue
+                if not acknowledged:
+                    logger.error("[handoff] New process did not take the sockets over")
+                    self.resume_services()
+                    continue
+                logger.info(
+                    f"[handoff] Handed {len(self.connectors)} sockets over, exiting"
+                )
+                logger.complete()
+                # exit without the shutdown cleanup so the spool is kept, the new
+                # process continues once this connection is closed
+                listener.close()
+                os._exit(0)
@@ -1,7 +1,8 @@
 """Import configuration for tunnel_over_anything"""
 
 # Standard libraries
-from typing import Literal
+import socket
+from typing import Literal, Optional
 
 # Third-party libraries
 import toml
@@ -21,6 +22,17 @@ class ConnectorConfig:
     )
     recv_path: str = field(validator=validators.instance_of(str))
     tx_path: str = field(validator=validators.instance_of(str))
+    scheduler: str = field(
+        validator=validators.and_(
+            validators.instance_of(str), validators.in_(df.SCHEDULER_MODES)
+        )
+    )
+    quantum: int = field(converter=int, validator=validators.ge(1))
+    priority_size: int = field(converter=int, validator=validators.ge(0))
+    packet_rate: float = field(converter=float, validator=validators.ge(0))
+    byte_rate: float = field(converter=float, validator=validators.ge(0))
+    burst: float = field(converter=float, validator=validators.gt(0))
+    adaptive_pacing: bool = field(validator=validators.instance_of(bool))
 
 
 @define
@@ -28,24 +40,34 @@ class ClientConfig(ConnectorConfig):
     """Defines the ClientConfig class for configuring ClientConnector objects"""
 
     @classmethod
-    def from_dict(cls, data: dict, mode: Literal["server", "client"]):
+    def from_dict(
+        cls, data: dict, mode: Literal["server", "client"], spool_dir: str = ""
+    ):
         """Creates a ClientConfig object from a dictionary
 
         Args:
             data: the dictionary with the client config
+            spool_dir: the spool directory of the tunnel relative to CLIENT_DIR
         """
         if mode == "client":
-            recv_path = df.INBOUND_RAW_PATH
-            tx_path = df.OUTBOUND_PROCESSED_PATH
+            recv_path = df.get_spool_path(spool_dir, df.INBOUND_RAW_PATH)
+            tx_path = df.get_spool_path(spool_dir, df.OUTBOUND_PROCESSED_PATH)
         else:
-            recv_path = df.OUTBOUND_RAW_PATH
-            tx_path = df.INBOUND_PROCESSED_PATH
+            recv_path = df.get_spool_path(spool_dir, df.OUTBOUND_RAW_PATH)
+            tx_path = df.get_spool_path(spool_dir, df.INBOUND_PROCESSED_PATH)
 
         return cls(
             endpoint=data["endpoint"],
             port=data["port"],
             recv_path=recv_path,
             tx_path=tx_path,
+            scheduler=data.get("scheduler", "fifo").lower(),
+            quantum=data.get("quantum", df.DEFAULT_SCHEDULER_QUANTUM),
+            priority_size=data.get("priority_size", df.DEFAULT_PRIORITY_SIZE),
+            packet_rate=data.get("packet_rate", 0),
+            byte_rate=data.get("byte_rate", 0),
+            burst=data.get("burst", df.DEFAULT_BURST),
+            adaptive_pacing=data.get("adaptive_pacing", False),
         )
 
 
@@ -54,23 +76,33 @@ class ServerConfig(ConnectorConfig):
     """Defines the ServerConfig class for configuring ServerConnector objects"""
 
     @classmethod
-    def from_dict(cls, data: dict, mode: Literal["server", "client"]):
+    def from_dict(
+        cls, data: dict, mode: Literal["server", "client"], spool_dir: str = ""
+    ):
         """Creates a ServerConfig object from a dictionary
 
         Args:
             data: the dictionary with the server config
+            spool_dir: the spool directory of the tunnel relative to CLIENT_DIR
         """
         if mode == "client":
-            recv_path = df.OUTBOUND_RAW_PATH
-            tx_path = df.INBOUND_PROCESSED_PATH
+            recv_path = df.get_spool_path(spool_dir, df.OUTBOUND_RAW_PATH)
+            tx_path = df.get_spool_path(spool_dir, df.INBOUND_PROCESSED_PATH)
         else:
-            recv_path = df.INBOUND_RAW_PATH
-            tx_path = df.OUTBOUND_PROCESSED_PATH
+            recv_path = df.get_spool_path(spool_dir, df.INBOUND_RAW_PATH)
+            tx_path = df.get_spool_path(spool_dir, df.OUTBOUND_PROCESSED_PATH)
         return cls(
             endpoint=data["endpoint"],
             port=data["port"],
             recv_path=recv_path,
             tx_path=tx_path,
+            scheduler=data.get("scheduler", "fifo").lower(),
+            quantum=data.get("quantum", df.DEFAULT_SCHEDULER_QUANTUM),
+            priority_size=data.get("priority_size", df.DEFAULT_PRIORITY_SIZE),
+            packet_rate=data.get("packet_rate", 0),
+            byte_rate=data.get("byte_rate", 0),
+            burst=data.get("burst", df.DEFAULT_BURST),
+            adaptive_pacing=data.get("adaptive_pacing", False),
         )
 
 
@@ -93,32 +125,128 @@ class PacketConfig:
             validators.instance_of(str), validators.in_(["server", "client"])
         )
     )
+    edns_size: int = field(
+        converter=int,
+        validator=validators.or_(
+            validators.in_((0,)),
+            validators.and_(validators.ge(512), validators.le(65535)),
+        ),
+    )
+    framing: bool = field(validator=validators.instance_of(bool))
+    probe_interval: float = field(converter=float, validator=validators.ge(0))
+    poll_hold: int = field(converter=int, validator=validators.ge(0))
+    poll_interval: float = field(converter=float, validator=validators.gt(0))
+    poll_max_interval: float = field(converter=float, validator=validators.gt(0))
+    poll_timeout: float = field(converter=float, validator=validators.gt(0))
+    filter: bool = field(validator=validators.instance_of(bool))
+    filter_key: Optional[str] = field(
+        validator=validators.optional(validators.instance_of(str))
+    )
+    filter_rate: float = field(converter=float, validator=validators.ge(0))
+    filter_burst: float = field(converter=float, validator=validators.gt(0))
+    spool_dir: str = field(validator=validators.instance_of(str))
+
+    @probe_interval.validator
+    def check_probe_framing(self, attribute, value):
+        """Probes can only be told apart from data when framing is enabled"""
+        if value > 0 and not self.framing:
+            raise ValueError("probe_interval requires framing = true")
+
+    @poll_hold.validator
+    def check_poll_framing(self, attribute, value):
+        """Polls can only be told apart from data when framing is enabled"""
+        if value > 0 and not self.framing:
+            raise ValueError("poll_hold requires framing = true")
+
+    @poll_max_interval.validator
+    def check_poll_interval(self, attribute, value):
+        """The poll interval backs off from poll_interval up to poll_max_interval"""
+        if value < self.poll_interval:
+            raise ValueError("poll_max_interval must be at least poll_interval")
+
+    @filter_key.validator
+    def check_filter_framing(self, attribute, value):
+        """The tag is only added when both ends are Tunnel over Anything instances"""
+        if value and not self.framing:
+            raise ValueError("filter_key requires framing = true")
 
     @classmethod
-    def from_dict(cls, data: dict, mode: Literal["server", "client"]):
+    def from_dict(
+        cls, data: dict, mode: Literal["server", "client"], spool_dir: str = ""
+    ):
         """Creates a PacketConfig object from a dictionary
 
         Args:
             data: the dictionary with the packet config
+            spool_dir: the spool directory of the tunnel relative to CLIENT_DIR
         """
         return cls(
             protocol=data["protocol"].lower(),
             encoding=data["encoding".lower()],
             mode=mode,
+            edns_size=data.get("edns_size", df.DEFAULT_EDNS_SIZE),
+            framing=data.get("framing", False),
+            probe_interval=data.get("probe_interval", 0),
+            poll_hold=data.get("poll_hold", 0),
+            poll_interval=data.get("poll_interval", df.DEFAULT_POLL_INTERVAL),
+            poll_max_interval=data.get(
+                "poll_max_interval", df.DEFAULT_POLL_MAX_INTERVAL
+            ),
+            poll_timeout=data.get("poll_timeout", df.DEFAULT_POLL_TIMEOUT),
+            filter=data.get("filter", False),
+            filter_key=data.get("filter_key"),
+            filter_rate=data.get("filter_rate", 0),
+            filter_burst=data.get("filter_burst", df.DEFAULT_FILTER_BURST),
+            spool_dir=spool_dir,
         )
 
 
 @define
-class Config:
-    """Defines the Config class for importing the config.toml"""
+class ChannelConfig:
+    """Defines the ChannelConfig class for configuring an additional service that is
+    multiplexed over the tunnel, in client mode the connector listens for the local
+    service and in server mode it connects to the remote target"""
+
+    id: int = field(
+        converter=int, validator=validators.and_(validators.ge(1), validators.le(65535))
+    )
+    connector: ClientConfig | ServerConfig = field(
+        validator=validators.instance_of((ClientConfig, ServerConfig))
+    )
 
+    @classmethod
+    def from_dict(
+        cls, data: dict, mode: Literal["server", "client"], spool_dir: str = ""
+    ):
+        """Creates a ChannelConfig object from a dictionary
+
+        Args:
+            data: the dictionary with the channel id and connector config
+            spool_dir: the spool directory of the tunnel relative to CLIENT_DIR
+        """
+        # the channel replaces the connector facing the raw data
+        connector_config = ServerConfig if mode == "client" else ClientConfig
+        return cls(
+            id=data["id"],
+            connector=connector_config.from_dict(data, mode=mode, spool_dir=spool_dir),
+        )
+
+
+@define
+class TunnelConfig:
+    """Defines the TunnelConfig class for configuring a single tunnel"""
+
+    name: str = field(
+        validator=validators.and_(
+            validators.instance_of(str), validators.matches_re(r"[A-Za-z0-9_-]+")
+        )
+    )
     client: ClientConfig = field(validator=validators.instance_of(ClientConfig))
     server: ServerConfig = field(validator=validators.instance_of(ServerConfig))
     packet: PacketConfig = field(validator=validators.instance_of(PacketConfig))
-    log_level: str = field(
-        validator=validators.and_(
-            validators.instance_of(str),
-            validators.in_(["TRACE", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]),
+    channels: list[ChannelConfig] = field(
+        validator=validators.deep_iterable(
+            member_validator=validators.instance_of(ChannelConfig)
         )
     )
     mode: str = field(
@@ -126,22 +254,115 @@ class Config:
             validators.instance_of(str), validators.in_(["server", "client"])
         )
     )
+    spool_dir: str = field(validator=validators.instance_of(str))
+    capture_path: Optional[str] = field(
+        validator=validators.optional(validators.instance_of(str))
+    )
+
+    @channels.validator
+    def check_channels(self, attribute, value):
+        """Channels are told apart by the frame header and must have unique ids"""
+        if value and not self.packet.framing:
+            raise ValueError("channel requires framing = true")
+        ids = [channel.id for channel in value]
+        if len(ids) != len(set(ids)):
+            raise ValueError(f"Channel ids must be unique, got {ids}")
+
+    @classmethod
+    def from_dict(cls, data: dict, name: str, spool_dir: str):
+        """Creates a TunnelConfig object from a dictionary
+
+        Args:
+            data: the dictionary with the mode, client, server, packet and channel
+                config
+            name: the name of the tunnel (for logging only)
+            spool_dir: the spool directory of the tunnel relative to CLIENT_DIR
+        """
+        mode = data["mode"].lower()
+        return cls(
+            name=name,
+            mode=mode,
+            spool_dir=spool_dir,
+            client=ClientConfig.from_dict(
+                data["client"], mode=mode, spool_dir=spool_dir
+            ),
+            server=ServerConfig.from_dict(
+                data["server"], mode=mode, spool_dir=spool_dir
+            ),
+            packet=PacketConfig.from_dict(
+                data["packet"], mode=mode, spool_dir=spool_dir
+            ),
+            channels=[
+                ChannelConfig.from_dict(channel, mode=mode, spool_dir=spool_dir)
+                for channel in data.get("channel", [])
+            ],
+            capture_path=data.get("capture_path"),
+        )
+
+
+@define
+class Config:
+    """Defines the Config class for importing the config.toml"""
+
+    tunnels: list[TunnelConfig] = field(
+        validator=validators.deep_iterable(
+            member_validator=validators.instance_of(TunnelConfig),
+            iterable_validator=validators.min_len(1),
+        )
+    )
+    log_level: str = field(
+        validator=validators.and_(
+            validators.instance_of(str),
+            validators.in_(["TRACE", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]),
+        )
+    )
+    handoff_path: Optional[str] = field(
+        validator=validators.optional(validators.instance_of(str))
+    )
+
+    @handoff_path.validator
+    def check_handoff_support(self, attribute, value):
+        """Handoffs pass the sockets as file descriptors over a UNIX socket"""
+        if value is not None and not hasattr(socket, "send_fds"):
+            raise ValueError("handoff_path is not supported on this platform")
+
+    @tunnels.validator
+    def check_unique_names(self, attribute, value):
+        """Ensures no two tunnels share a name and therefore a spool directory"""
+        names = [tunnel.name for tunnel in value]
+        if len(names) != len(set(names)):
+            raise ValueError(f"Tunnel names must be unique, got {names}")
 
     @classmethod
     def load_config(cls, file_path: str = f"{df.CLIENT_DIR}/config.toml"):
         """Creates a Config object from a dictionary
 
+        A config either describes a single tunnel with top level mode, [client],
+        [server] and [packet] tables and optional [[channel]] entries, or several
+        tunnels as a [[tunnel]] array where each entry has a name, mode,
+        [tunnel.client], [tunnel.server], [tunnel.packet] and [[tunnel.channel]]
+
         Args:
             file_name: the name of the toml config file
         """
         with open(file=file_path, mode="r", encoding="utf-8") as file:
             config_dict = toml.load(file)
 
-            mode = config_dict["mode"].lower()
+        if "tunnel" in config_dict:
+            tunnels = [
+                TunnelConfig.from_dict(
+                    tunnel,
+                    name=tunnel["name"],
+                    spool_dir=f"{df.TUNNELS_PATH}/{tunnel['name']}",
+                )
+                for tunnel in config_dict["tunnel"]
+            ]
+        else:
+            tunnels = [
+                TunnelConfig.from_dict(config_dict, name="default", spool_dir="")
+            ]
         return cls(
             log_level=config_dict["log_level"].upper(),
-            mode=mode,
-            client=ClientConfig.from_dict(config_dict["client"], mode=mode),
-            server=ServerConfig.from_dict(config_dict["server"], mode=mode),
-            packet=PacketConfig.from_dict(config_dict["packet"], mode=mode),
+            tunnels=tunnels,
+            handoff_path=config_dict.get("handoff_path"),
         )
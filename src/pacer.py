@@ -0,0 +1,220 @@
+"""Token bucket pacing for the connector transmitters"""
+
+# Standard libraries
+import threading
+import time
+from typing import Optional
+
+# Third-party libraries
+from loguru import logger
+
+ADAPT_INTERVAL = 1.0  # seconds between adaptive rate adjustments
+LOSS_THRESHOLD = 0.02  # loss ratio above which the adaptive rate is decreased
+DECREASE_FACTOR = 0.8
+INCREASE_STEP = 0.05  # fraction of the configured rate added per interval
+MIN_RATE_FACTOR = 0.1  # the adaptive rate never drops below this fraction
+LOSS_SMOOTHING = 0.25  # EWMA weight of the newest loss sample
+
+
+class TokenBucket:
+    """Defines the TokenBucket class which allows rate tokens per second with up to
+    capacity tokens saved up for bursts"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+
+    def refill(self, now: float):
+        """Adds the tokens earned since the last refill
+
+        Args:
+            now: The current time.monotonic() value
+        """
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last_refill) * self.rate
+        )
+        self.last_refill = now
+
+    def delay(self) -> float:
+        """Returns the number of seconds until the bucket is no longer in debt
+
+        Returns:
+            The delay in seconds, 0 if a packet may be sent immediately
+        """
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def consume(self, amount: float):
+        """Takes tokens from the bucket, the bucket may go into debt so packets larger
+        than the capacity can still be sent
+
+        Args:
+            amount: The number of tokens to take
+        """
+        self.tokens -= amount
+
+
+class Pacer:
+    """Defines the Pacer class which limits a transmitter to a packet and byte rate,
+    optionally lowering the rate while packets are being lost. The loss is counted from
+    the transmitter's failed sends until a path prober reports its own loss estimate"""
+
+    def __init__(
+        self,
+        packet_rate: float,
+        byte_rate: float,
+        burst: float,
+        adaptive: bool = False,
+        name: str = "pacer",
+    ):
+        self.name = name
+        self.adaptive = adaptive
+        self.scale = 1.0
+        self.loss = 0.0
+        self.sent = 0
+        self.lost = 0
+        self.probed = False
+        self.last_adapt = time.monotonic()
+        # the loss is reported by the transmitter and prober threads
+        self.lock = threading.Lock()
+
+        # a bucket always holds at least one token, a packet larger than the byte
+        # bucket still passes by putting the bucket into debt which delays the next one
+        self.packet_bucket = (
+            TokenBucket(rate=packet_rate, capacity=max(packet_rate * burst, 1))
+            if packet_rate > 0
+            else None
+        )
+        self.byte_bucket = (
+            TokenBucket(rate=byte_rate, capacity=max(byte_rate * burst, 1))
+            if byte_rate > 0
+            else None
+        )
+        self.packet_rate = packet_rate
+        self.byte_rate = byte_rate
+
+    def delay(self) -> float:
+        """Returns the number of seconds until the next packet may be sent, lets the
+        shared transmitter serve other tunnels instead of sleeping
+
+        Returns:
+            The delay in seconds, 0 if a packet may be sent immediately
+        """
+        now = time.monotonic()
+        delay = 0.0
+        for bucket in (self.packet_bucket, self.byte_bucket):
+            if bucket is not None:
+                bucket.refill(now)
+                delay = max(delay, bucket.delay())
+        return delay
+
+    def consume(self, size: int):
+        """Takes the tokens of a packet that is being sent
+
+        Args:
+            size: The size of the packet in bytes
+        """
+        if self.packet_bucket is not None:
+            self.packet_bucket.consume(1)
+        if self.byte_bucket is not None:
+            self.byte_bucket.consume(size)
+
+    def wait(self, size: int):
+        """Blocks until a packet of the given size may be sent and takes its tokens
+
+        Args:
+            size: The size of the packet in bytes
+        """
+        if (delay := self.delay()) > 0:
+            time.sleep(delay)
+            self.delay()
+        self.consume(size)
+
+    def report(self, sent: int, lost: int):
+        """Records sent and failed packets of the transmitter, ignored once a path
+        prober reports the loss through set_loss
+
+        Args:
+            sent: The number of packets sent
+            lost: The number of those packets that were lost
+        """
+        if not self.adaptive:
+            return
+        with self.lock:
+            if self.probed:
+                return
+            self.sent += sent
+            self.lost += lost
+            now = time.monotonic()
+            if now - self.last_adapt < ADAPT_INTERVAL or self.sent == 0:
+                return
+            self.loss += LOSS_SMOOTHING * (self.lost / self.sent - self.loss)
+            self.sent = 0
+            self.lost = 0
+            self.adapt(now)
+
+    def set_loss(self, loss: float):
+        """Replaces the transmitter's loss count with the smoothed loss measured by a
+        path prober, I.E: PathProber.loss
+
+        Args:
+            loss: The smoothed loss ratio of the path
+        """
+        if not self.adaptive:
+            return
+        with self.lock:
+            self.probed = True
+            self.loss = loss
+            now = time.monotonic()
+            if now - self.last_adapt >= ADAPT_INTERVAL:
+                self.adapt(now)
+
+    def adapt(self, now: float):
+        """Decreases the rate multiplicatively while the smoothed loss exceeds
+        LOSS_THRESHOLD and increases it additively otherwise, called with lock held
+
+        Args:
+            now: The current time.monotonic() value
+        """
+        if self.loss > LOSS_THRESHOLD:
+            scale = max(self.scale * DECREASE_FACTOR, MIN_RATE_FACTOR)
+        else:
+            scale = min(self.scale + INCREASE_STEP, 1.0)
+        if scale != self.scale:
+            self.scale = scale
+            logger.debug(
+                f"[{self.name}] Loss {self.loss:.1%}, pacing at {self.scale:.0%} "
+                f"of the configured rate"
+            )
+            if self.packet_bucket is not None:
+                self.packet_bucket.rate = self.packet_rate * self.scale
+            if self.byte_bucket is not None:
+                self.byte_bucket.rate = self.byte_rate * self.scale
+        self.last_adapt = now
+
+
+def create_pacer(
+    packet_rate: float, byte_rate: float, burst: float, adaptive: bool, name: str
+) -> Optional[Pacer]:
+    """Creates a Pacer or returns None if neither rate is limited
+
+    Args:
+        packet_rate: Maximum packets per second, 0 is unlimited
+        byte_rate: Maximum bytes per second, 0 is unlimited
+        burst: Seconds worth of tokens that may be saved up for a burst
+        adaptive: Whether to lower the rate when packets are lost
+        name: Name of the pacer (for logging only)
+
+    Returns:
+        The Pacer or None
+    """
+    if packet_rate <= 0 and byte_rate <= 0:
+        return None
+    return Pacer(
+        packet_rate=packet_rate,
+        byte_rate=byte_rate,
+        burst=burst,
+        adaptive=adaptive,
+        name=name,
+    )
@@ -1,9 +1,13 @@
 """Defines the packet_assembler class for converting outbound packets to the transport packets"""
 
 # Standard libraries
+import binascii
+import itertools
 import os
+import threading
 from base64 import b64decode, b64encode, b85decode, b85encode
-from typing import Optional
+from functools import partial
+from typing import Callable, Optional
 from urllib import parse
 
 # Third-party libraries
@@ -11,8 +15,42 @@ from loguru import logger
 
 # Project libraries
 import src.default as df
+from src.buffer_pool import BufferPool
+from src.framing import (
+    FRAME_CHANNEL_DATA,
+    FRAME_DATA,
+    FRAME_POLL,
+    FRAME_PROBE,
+    FRAME_PROBE_REPLY,
+    build_data_frame,
+    pack_data_frame,
+    parse_channel_data,
+    parse_frame,
+)
 from src.load_config import PacketConfig
+from src.packet_filter import PacketFilter
 from src.packet_lib.dns import assemble_dns_packet, disassemble_dns_packet
+from src.poll import Poller
+from src.probe import PathProber, build_probe_reply
+from src.scheduler import get_channel
+from src.traffic_stats import TrafficCounter
+
+BATCH_SIZE = 32  # spooled packets read and converted per batch
+
+
+def encode_base85(data: bytes | memoryview) -> bytes:
+    """Encodes data to url-safe base85"""
+    return bytes(parse.quote_from_bytes(b85encode(data)), encoding="ascii")
+
+
+def decode_base85(data: bytes | memoryview) -> bytes:
+    """Decodes url-safe base85 data"""
+    return b85decode(parse.unquote_to_bytes(bytes(data)))
+
+
+def passthrough(data: bytes | memoryview) -> bytes | memoryview:
+    """Returns the data unchanged, used by the none encoding and protocol"""
+    return data
 
 
 class PacketConverter:
@@ -23,11 +61,39 @@ class PacketConverter:
         self.packet_type = config.protocol
         self.encoding = config.encoding
         self.mode = config.mode
-
-        self.assemble_source = df.OUTBOUND_RAW_PATH
-        self.assemble_destination = df.OUTBOUND_PROCESSED_PATH
-        self.disassemble_source = df.INBOUND_RAW_PATH
-        self.disassemble_destination = df.INBOUND_PROCESSED_PATH
+        self.edns_size = config.edns_size
+        self.framing = config.framing
+        self.prober: Optional[PathProber] = None
+        self.poller: Optional[Poller] = None
+        self.packet_filter: Optional[PacketFilter] = None
+        # the channels served by a local connector, frames of any other channel would
+        # never be transmitted and are dropped
+        self.channels: set[int] = {0}
+        self.unknown_channels = TrafficCounter(
+            name="unknown channels", action="Dropped"
+        )
+        self.assembled = TrafficCounter(name="assembler", action="Assembled")
+        self.disassembled = TrafficCounter(name="disassembler", action="Disassembled")
+        # wakes the shared transmitter once a control frame has been queued
+        self.on_inject: Optional[Callable[[], None]] = None
+
+        self.assemble_source = df.get_spool_path(config.spool_dir, df.OUTBOUND_RAW_PATH)
+        self.assemble_destination = df.get_spool_path(
+            config.spool_dir, df.OUTBOUND_PROCESSED_PATH
+        )
+        self.disassemble_source = df.get_spool_path(
+            config.spool_dir, df.INBOUND_RAW_PATH
+        )
+        self.disassemble_destination = df.get_spool_path(
+            config.spool_dir, df.INBOUND_PROCESSED_PATH
+        )
+        self.pool = BufferPool(max_buffers=BATCH_SIZE)
+        # control frames are injected by several threads, the sequence keeps their
+        # names unique within the same microsecond
+        self.control_sequence = itertools.count()
+        # frames are built in a buffer of the calling thread before being encoded,
+        # assemble_batch is called by the assembler and the threads injecting frames
+        self.scratch = threading.local()
 
     def grab_captures(self, path: str) -> list[str]:
         """Returns the list of raw packet filenames from oldest to newest
@@ -35,32 +101,35 @@ class PacketConverter:
         Returns:
             List of the sorted raw packet filenames from oldest to newest
         """
-        packet_list = os.listdir(path=f"{df.CLIENT_DIR}/{path}")
+        packet_list = [
+            packet
+            for packet in os.listdir(path=f"{df.CLIENT_DIR}/{path}")
+            if packet.endswith(".bin")
+        ]
         packet_list.sort()  # sort from oldest to newest
 
         return packet_list
 
-    def read_packet(self, path: str) -> bytes:
-        """Returns a specified packet as a byte string
+    def read_packet(self, path: str) -> tuple[bytearray, memoryview]:
+        """Reads a specified packet into a pooled buffer
 
         Args:
             path: Local path to the binary file
 
         Returns:
-            The contents of the binary files as a byte string
+            The buffer (to be released back to the pool) and a view of the
+                contents of the binary file
         """
-        with open(file=path, mode="rb") as file:
-            return file.read()
+        return self.pool.read_file(path=path)
 
-    def write_packet(self, path: str, packet: bytes):
+    def write_packet(self, path: str, packet: bytes | memoryview):
         """Writes a packet byte string to a specified file
 
         Args:
             path: Path to the desired file
             packet: The byte string to write
         """
-        with open(file=path, mode="wb") as file:
-            file.write(packet)
+        df.write_packet_file(path=path, packet=packet)
 
     def delete_packet(self, path: str):
         """Deletes a given file
@@ -73,169 +142,426 @@ class PacketConverter:
         except PermissionError:
             logger.error(f"[{self}] Permission denied when attempting to delete {path}")
 
-    def encode_data(self, data: bytes) -> bytes:
-        """Encodes data to the protocol specified in the PacketConverter config
+    def get_scratch(self) -> bytearray:
+        """Returns the scratch buffer of the calling thread
 
-        Args:
-            data: byte string to encode
+        Returns:
+            The buffer frames are built in before being encoded
+        """
+        if (buffer := getattr(self.scratch, "buffer", None)) is None:
+            buffer = self.scratch.buffer = bytearray()
+        return buffer
+
+    def get_encoder(self) -> Callable[[bytes | memoryview], bytes | memoryview]:
+        """Returns the encoder of the encoding specified in the PacketConverter config
+
+        Raises:
+            KeyError: Raises an error if the encoding is invalid or unsupported
 
         Returns:
-            encoded byte string
+            A function that encodes a byte string
         """
         match (self.encoding):
             case "base64":
-                return b64encode(data)
+                return b64encode
             case "base85":
-                return bytes(parse.quote_from_bytes(b85encode(data)), encoding="ascii")
+                return encode_base85
             case "none":
-                return data
+                return passthrough
             case _:
                 raise KeyError(
                     f"Invalid or unsupported encoding method {self.encoding}"
                 )
 
-    def decode_data(self, data: bytes) -> bytes:
-        """Decodes data to the protocol specified in the PacketConverter config
+    def get_decoder(self) -> Callable[[bytes | memoryview], bytes | memoryview]:
+        """Returns the decoder of the encoding specified in the PacketConverter config
 
-        Args:
-            data: byte string to decode
+        Raises:
+            KeyError: Raises an error if the encoding is invalid or unsupported
 
         Returns:
-            Decoded byte string
+            A function that decodes a byte string
         """
         match (self.encoding):
             case "base64":
-                return b64decode(data)
+                return b64decode
             case "base85":
-                return b85decode(parse.unquote_to_bytes(data))
+                return decode_base85
             case "none":
-                return data
+                return passthrough
             case _:
                 raise KeyError(
                     f"Invalid or unsupported encoding method {self.encoding}"
                 )
 
-    def assemble_packet(self, data: bytes) -> bytes:
-        """Takes a byte string and assembles it into a DNS packet
-
-        Args:
-            data: The data to hide in the DNS packet
+    def get_assembler(self) -> Callable[[bytes | memoryview], bytes | memoryview]:
+        """Returns the function that wraps encoded data in the configured protocol
 
         Raises:
             KeyError: Raises an error if the PacketConverter object
                 has an invalid or unsupported packet_type
 
         Returns:
-            The assembled packet as a byte string
+            A function that assembles encoded data into a packet
         """
-        encoded_data = self.encode_data(data)
         match self.packet_type:
             case "dns":
-                return assemble_dns_packet(encoded_data)
+                return partial(assemble_dns_packet, edns_size=self.edns_size)
             case "none":
-                return encoded_data
+                return passthrough
             case _:
                 raise KeyError(f"[assembler] Invalid packet type {self.packet_type}")
 
-    def disassemble_packet(self, packet: bytes) -> Optional[bytes]:
-        """Takes an assembled packet and returns the hidden data
-
-        Args:
-            data: The packet bytes to dissect
+    def get_disassembler(
+        self,
+    ) -> Callable[[bytes | memoryview], Optional[bytes | memoryview]]:
+        """Returns the function that extracts the encoded data from a packet of the
+        configured protocol
 
         Raises:
             KeyError: Raises an error if the PacketConverter object
                 has an invalid or unsupported packet_type
 
         Returns:
-            The data hidden in the packet as a byte string or None
-                if the dissection failed
+            A function that returns the encoded data or None if the dissection failed
         """
-        encoded_data = None
         match self.packet_type:
             case "dns":
-                encoded_data = disassemble_dns_packet(packet_bytes=packet)
+                return disassemble_dns_packet
             case "none":
-                encoded_data = packet
+                return passthrough
             case _:
                 raise KeyError(f"[disassembler] Invalid packet type {self.packet_type}")
-        if encoded_data is None:
-            return encoded_data
 
-        return self.decode_data(encoded_data)
+    def encode_data(self, data: bytes | memoryview) -> bytes | memoryview:
+        """Encodes data to the protocol specified in the PacketConverter config
 
-    def assembler_service(self):
-        """Starts the assemble packets service, this takes packets from raw_capture and
-        builds them into assembled DNS packets in assembled_packets
+        Args:
+            data: byte string to encode
+
+        Returns:
+            encoded byte string
         """
-        logger.info(
-            f"[assembler] Started packet assembler "
-            f"({self.assemble_source} -> {self.assemble_destination})"
-        )
-        while True:
-            packet_list = self.grab_captures(path=self.assemble_source)
-            if len(packet_list) == 0:
+        return self.get_encoder()(data)
+
+    def decode_data(self, data: bytes | memoryview) -> bytes | memoryview:
+        """Decodes data to the protocol specified in the PacketConverter config
+
+        Args:
+            data: byte string to decode
+
+        Returns:
+            Decoded byte string
+        """
+        return self.get_decoder()(data)
+
+    def assemble_packet(
+        self, data: bytes | memoryview, channel: int = 0
+    ) -> bytes | memoryview:
+        """Takes a byte string and assembles it into a DNS packet
+
+        Args:
+            data: The data to hide in the DNS packet
+            channel: The channel the data belongs to, only sent when framing is enabled
+
+        Raises:
+            KeyError: Raises an error if the PacketConverter object
+                has an invalid or unsupported packet_type
+
+        Returns:
+            The assembled packet as a byte string
+        """
+        return self.assemble_batch(packets=[data], channels=[channel])[0]
+
+    def assemble_batch(
+        self,
+        packets: list[bytes | memoryview],
+        channels: Optional[list[int]] = None,
+    ) -> list[bytes | memoryview]:
+        """Assembles several byte strings into packets, the encoder and protocol are
+        only looked up once per batch
+
+        Args:
+            packets: The data to hide in the packets
+            channels: The channel of each packet, only sent when framing is enabled,
+                defaults to channel 0
+
+        Raises:
+            KeyError: Raises an error if the PacketConverter object
+                has an invalid or unsupported packet_type
+
+        Returns:
+            The assembled packets in the same order as packets
+        """
+        encode = self.get_encoder()
+        assemble = self.get_assembler()
+        if channels is None:
+            channels = [0] * len(packets)
+        # the frame can be built in the scratch buffer when the encoder copies it,
+        # without encoding the frame itself is the assembled data
+        scratch = self.get_scratch() if encode is not passthrough else None
+
+        assembled_packets = []
+        for data, channel in zip(packets, channels):
+            if self.framing:
+                data = (
+                    pack_data_frame(scratch, channel, data)
+                    if scratch is not None
+                    else build_data_frame(channel, data)
+                )
+            assembled_packets.append(assemble(encode(data)))
+        if self.packet_filter is not None:
+            return [self.packet_filter.sign(packet) for packet in assembled_packets]
+        return assembled_packets
+
+    def assemble_frame(self, data: bytes | memoryview) -> bytes | memoryview:
+        """Encodes and assembles data that is already framed (or unframed if framing
+        is disabled) into a packet
+
+        Args:
+            data: The data to hide in the packet
+
+        Raises:
+            KeyError: Raises an error if the PacketConverter object
+                has an invalid or unsupported packet_type
+
+        Returns:
+            The assembled packet as a byte string
+        """
+        packet = self.get_assembler()(self.encode_data(data))
+        if self.packet_filter is not None:
+            return self.packet_filter.sign(packet)
+        return packet
+
+    def disassemble_packet(
+        self, packet: bytes | memoryview
+    ) -> tuple[Optional[int], Optional[bytes | memoryview]]:
+        """Takes an assembled packet and returns the hidden data
+
+        Args:
+            data: The packet bytes to dissect
+
+        Raises:
+            KeyError: Raises an error if the PacketConverter object
+                has an invalid or unsupported packet_type
+
+        Returns:
+            The channel and the data hidden in the packet as a tuple or a
+                (None, None) tuple if the dissection failed
+        """
+        return self.disassemble_batch(packets=[packet])[0]
+
+    def disassemble_batch(
+        self, packets: list[bytes | memoryview]
+    ) -> list[tuple[Optional[int], Optional[bytes | memoryview]]]:
+        """Extracts the hidden data from several assembled packets, the protocol and
+        decoder are only looked up once per batch
+
+        Args:
+            packets: The packet bytes to dissect
+
+        Raises:
+            KeyError: Raises an error if the PacketConverter object
+                has an invalid or unsupported packet_type
+
+        Returns:
+            The channel and data of each packet as a tuple or a (None, None) tuple if
+                the dissection or decoding failed, in the same order as packets
+        """
+        disassemble = self.get_disassembler()
+        decode = self.get_decoder()
+
+        results = []
+        for packet in packets:
+            if (encoded_data := disassemble(packet)) is None:
+                results.append((None, None))
                 continue
+            try:
+                data = decode(encoded_data)
+            except (binascii.Error, ValueError) as e:
+                # junk that passed the listener must not end the whole batch
+                logger.debug("[disassembler] Dropping undecodable packet: {}", e)
+                results.append((None, None))
+                continue
+            results.append(self.handle_frame(data) if self.framing else (0, data))
+        return results
+
+    def handle_frame(
+        self, frame: bytes | memoryview
+    ) -> tuple[Optional[int], Optional[bytes | memoryview]]:
+        """Answers or consumes control frames and unwraps data frames
+
+        Args:
+            frame: The decoded frame
+
+        Returns:
+            The channel and data of a data frame as a tuple or a (None, None) tuple
+                if the frame was a control frame or malformed
+        """
+        frame_type, payload = parse_frame(frame)
+        if frame_type in (FRAME_DATA, FRAME_CHANNEL_DATA) and self.poller is not None:
+            # downstream data answered one of the polls
+            self.poller.handle_data()
+        if frame_type == FRAME_DATA:
+            return (0, payload)
+        if frame_type == FRAME_CHANNEL_DATA:
+            channel, data = parse_channel_data(payload)
+            if channel in self.channels:
+                return (channel, data)
+            if channel is not None:
+                logger.debug(
+                    "[disassembler] Dropping {} byte frame for unknown channel {}",
+                    len(data),
+                    channel,
+                )
+                self.unknown_channels.add(len(data))
+            else:
+                logger.error("[disassembler] Dropping malformed channel frame")
+        elif frame_type == FRAME_POLL:
+            # the listener already held the poll, it carries no data
+            pass
+        elif frame_type == FRAME_PROBE:
+            if (reply := build_probe_reply(payload)) is not None:
+                self.inject_frame(reply)
+        elif frame_type == FRAME_PROBE_REPLY:
+            if self.prober is not None:
+                self.prober.handle_reply(payload)
+        else:
+            logger.error("[disassembler] Dropping malformed frame")
+        return (None, None)
+
+    def inject_frame(self, frame: bytes):
+        """Assembles a control frame and queues it for transmission alongside the
+        assembled data packets
+
+        Args:
+            frame: The control frame to send
+        """
+        self.write_packet(
+            path=(
+                f"{df.CLIENT_DIR}/{self.assemble_destination}/"
+                f"{df.get_datetime()}-{next(self.control_sequence)}_control.bin"
+            ),
+            packet=self.assemble_frame(frame),
+        )
+        if self.on_inject is not None:
+            self.on_inject()
+
+    def idle(self):
+        """Flushes the traffic summaries of the converter while no packets arrive"""
+        self.assembled.idle()
+        self.disassembled.idle()
+        self.unknown_channels.idle()
+
+    def assemble_pending(self, limit: int) -> int:
+        """Takes up to limit packets from raw_capture and builds them into assembled
+        DNS packets in assembled_packets
+
+        Args:
+            limit: The maximum number of packets to assemble
+
+        Returns:
+            The number of packets taken from raw_capture
+        """
+        packet_list = self.grab_captures(path=self.assemble_source)[:limit]
+        if packet_list:
             logger.debug(
-                f"[assembler] Processing {len(packet_list)} "
-                f"packet{'s' if len(packet_list) > 1 else ''} in "
-                f"{self.assemble_source} {packet_list}"
+                "[assembler] Processing {} packet(s) in {} {}",
+                len(packet_list),
+                self.assemble_source,
+                packet_list,
             )
 
-            for packet in packet_list:
+        for batch_start in range(0, len(packet_list), BATCH_SIZE):
+            batch = packet_list[batch_start : batch_start + BATCH_SIZE]
+            buffers, packets = zip(
+                *(
+                    self.read_packet(
+                        path=f"{df.CLIENT_DIR}/{self.assemble_source}/{packet}"
+                    )
+                    for packet in batch
+                )
+            )
+            assembled_packets = self.assemble_batch(
+                packets=list(packets),
+                channels=[get_channel(packet) for packet in batch],
+            )
+
+            for packet, buffer, assembled_packet in zip(
+                batch, buffers, assembled_packets
+            ):
                 packet_source_path = f"{self.assemble_source}/{packet}"
                 packet_destination_path = f"{self.assemble_destination}/{packet}"
-                packet_bytes = self.read_packet(
-                    path=f"{df.CLIENT_DIR}/{packet_source_path}"
-                )
                 logger.debug(
-                    f"[assembler] {packet_source_path} -> {packet_destination_path}"
+                    "[assembler] {} -> {}",
+                    packet_source_path,
+                    packet_destination_path,
                 )
-
-                assembled_packet = self.assemble_packet(data=packet_bytes)
+                self.assembled.add(len(assembled_packet))
 
                 self.write_packet(
                     path=f"{df.CLIENT_DIR}/{packet_destination_path}",
                     packet=assembled_packet,
                 )
-                self.delete_packet(packet_source_path)
+                self.pool.release(buffer)
+                self.delete_packet(f"{df.CLIENT_DIR}/{packet_source_path}")
+        return len(packet_list)
+
+    def disassemble_pending(self, limit: int) -> int:
+        """Takes up to limit assembled DNS packets from inbound/raw_capture and
+        dissects the data into inbound/disassembled_packets
+
+        Args:
+            limit: The maximum number of packets to disassemble
 
-    def disassembler_service(self):
-        """Starts the packet disassembly service, this takes assembled DNS packets from
-        inbound/raw_capture and dissects the data into inbound/disassembled_packets
+        Returns:
+            The number of packets taken from inbound/raw_capture
         """
-        logger.info(
-            f"[disassembler] Started packet disassembler "
-            f"({self.disassemble_source} -> {self.disassemble_destination})"
-        )
-        while True:
-            packet_list = self.grab_captures(path=self.disassemble_source)
-            if len(packet_list) == 0:
-                continue
+        packet_list = self.grab_captures(path=self.disassemble_source)[:limit]
+        if packet_list:
             logger.debug(
-                f"[disassembler] Processing {len(packet_list)} "
-                f"packet{'s' if len(packet_list) > 1 else ''} in "
-                f"{self.disassemble_source} {packet_list}"
+                "[disassembler] Processing {} packet(s) in {} {}",
+                len(packet_list),
+                self.disassemble_source,
+                packet_list,
             )
 
-            for packet in packet_list:
+        for batch_start in range(0, len(packet_list), BATCH_SIZE):
+            batch = packet_list[batch_start : batch_start + BATCH_SIZE]
+            buffers, packets = zip(
+                *(
+                    self.read_packet(
+                        path=f"{df.CLIENT_DIR}/{self.disassemble_source}/{packet}"
+                    )
+                    for packet in batch
+                )
+            )
+            results = self.disassemble_batch(packets=list(packets))
+
+            for packet, buffer, (channel, disassembled_packet) in zip(
+                batch, buffers, results
+            ):
                 packet_source_path = f"{self.disassemble_source}/{packet}"
-                packet_destination_path = f"{self.disassemble_destination}/{packet}"
-                packet_bytes = self.read_packet(
-                    path=f"{df.CLIENT_DIR}/{packet_source_path}"
+                if disassembled_packet is None:
+                    self.pool.release(buffer)
+                    self.delete_packet(f"{df.CLIENT_DIR}/{packet_source_path}")
+                    continue
+                # retag the packet with its channel for the connector serving it
+                packet_destination_path = (
+                    f"{self.disassemble_destination}/"
+                    f"{packet.partition('_')[0]}_{channel}.bin"
                 )
                 logger.debug(
-                    f"[disassembler] {packet_source_path} -> {packet_destination_path}"
+                    "[disassembler] {} -> {}",
+                    packet_source_path,
+                    packet_destination_path,
                 )
-
-                if (
-                    disassembled_packet := self.disassemble_packet(packet=packet_bytes)
-                ) is None:
-                    self.delete_packet(packet_source_path)
-                    continue
+                self.disassembled.add(len(disassembled_packet))
 
                 self.write_packet(
                     path=f"{df.CLIENT_DIR}/{packet_destination_path}",
                     packet=disassembled_packet,
                 )
-                self.delete_packet(packet_source_path)
+                self.pool.release(buffer)
+                self.delete_packet(f"{df.CLIENT_DIR}/{packet_source_path}")
+        return len(packet_list)
@@ -0,0 +1,156 @@
+"""Cheap checks applied by the listener of the connector facing the remote instance so
+stray and junk packets are dropped before they are spooled and disassembled"""
+
+# Standard libraries
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Project libraries
+from src.packet_lib.dns import add_cookie_option, is_tunnel_query, split_cookie_option
+from src.pacer import TokenBucket
+from src.traffic_stats import TrafficCounter
+
+DNS_TAG_LENGTH = 8  # the tag is sent as the client cookie of an EDNS0 COOKIE option
+TAG_LENGTH = 4  # the tag is prefixed to packets of the none protocol
+MAX_SOURCES = 4096  # rate limited source addresses, the least recently seen is evicted
+
+
+class PacketFilter:
+    """Defines the PacketFilter class which checks the header of incoming packets,
+    verifies the keyed tag added by the assembler of the remote instance and limits the
+    packet rate of each source address. sign is called by the assembler, check by a
+    single listener thread"""
+
+    def __init__(
+        self,
+        protocol: str,
+        header_check: bool,
+        key: Optional[str] = None,
+        rate: float = 0,
+        burst: float = 1.0,
+    ):
+        self.protocol = protocol
+        self.header_check = header_check
+        self.key = hashlib.sha256(key.encode()).digest() if key else None
+        self.rate = rate
+        self.capacity = max(rate * burst, 1)
+        self.sources: OrderedDict[str, TokenBucket] = OrderedDict()
+        self.counter = TrafficCounter(name="filter", action="Dropped")
+
+    def get_tag(self, data: bytes | memoryview, length: int) -> bytes:
+        """Returns the keyed tag of data
+
+        Args:
+            data: The data to tag
+            length: The length of the tag in bytes
+
+        Returns:
+            The tag
+        """
+        return hashlib.blake2s(data, digest_size=length, key=self.key).digest()
+
+    def sign(self, packet: bytes | memoryview) -> bytes | memoryview:
+        """Adds the keyed tag to an assembled packet
+
+        Args:
+            packet: The assembled packet
+
+        Returns:
+            The tagged packet or packet if no key is configured
+        """
+        if self.key is None:
+            return packet
+        if self.protocol == "dns":
+            packet = add_cookie_option(packet, DNS_TAG_LENGTH)
+            return b"".join([packet, self.get_tag(packet, DNS_TAG_LENGTH)])
+        return b"".join([self.get_tag(packet, TAG_LENGTH), packet])
+
+    def verify(self, packet: memoryview) -> Optional[memoryview]:
+        """Checks the keyed tag of a received packet
+
+        Args:
+            packet: The received packet
+
+        Returns:
+            The packet without a tag that is not part of the protocol or None if the
+                tag does not match
+        """
+        if self.protocol == "dns":
+            if (parts := split_cookie_option(packet, DNS_TAG_LENGTH)) is None:
+                return None
+            signed, tag = parts
+            if not hmac.compare_digest(self.get_tag(signed, DNS_TAG_LENGTH), tag):
+                return None
+            # the COOKIE option is part of the query and ignored by the disassembler
+            return packet
+        if len(packet) < TAG_LENGTH:
+            return None
+        tag = self.get_tag(packet[TAG_LENGTH:], TAG_LENGTH)
+        if not hmac.compare_digest(tag, packet[:TAG_LENGTH]):
+            return None
+        return packet[TAG_LENGTH:]
+
+    def allow_source(self, address: tuple[str, int]) -> bool:
+        """Takes a token from the bucket of the source address
+
+        Args:
+            address: The source address of the received packet
+
+        Returns:
+            True if the source is within its packet rate
+        """
+        bucket = self.sources.get(address[0])
+        if bucket is None:
+            bucket = TokenBucket(rate=self.rate, capacity=self.capacity)
+            self.sources[address[0]] = bucket
+            if len(self.sources) > MAX_SOURCES:
+                self.sources.popitem(last=False)
+        else:
+            self.sources.move_to_end(address[0])
+        bucket.refill(time.monotonic())
+        if bucket.tokens < 1:
+            return False
+        bucket.consume(1)
+        return True
+
+    def check_header(self, packet: memoryview) -> bool:
+        """Checks the protocol header of a received packet
+
+        Args:
+            packet: The received packet
+
+        Returns:
+            True if the packet could have been built by the assembler
+        """
+        if self.protocol == "dns":
+            return is_tunnel_query(packet)
+        return len(packet) > 0
+
+    def check(
+        self, packet: memoryview, address: tuple[str, int]
+    ) -> Optional[memoryview]:
+        """Applies the rate limit, header check and tag check to a received packet,
+        cheapest first
+
+        Args:
+            packet: The received packet
+            address: The source address of the received packet
+
+        Returns:
+            The packet to spool or None if it was dropped
+        """
+        if self.rate > 0 and not self.allow_source(address):
+            self.counter.add(len(packet))
+            return None
+        if self.header_check and not self.check_header(packet):
+            self.counter.add(len(packet))
+            return None
+        if self.key is not None:
+            if (verified := self.verify(packet)) is None:
+                self.counter.add(len(packet))
+                return None
+            packet = verified
+        return packet
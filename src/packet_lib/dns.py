@@ -11,7 +11,14 @@ from loguru import logger
 from pypacker.layer567.dns import DNS
 from pypacker.pypacker import DissectException
 
-MAX_RECORD_LENGTH = 60
+MAX_LABEL_LENGTH = 63  # RFC 1035 2.3.4, the top two bits flag a compression pointer
+MAX_NAME_LENGTH = 255  # RFC 1035 2.3.4, wire length including the root label
+HEADER_LENGTH = 12
+POINTER_FLAG = 0xC000
+OPT_RECORD_TYPE = 41  # EDNS0 pseudo record (RFC 6891)
+MIN_UDP_SIZE = 512  # RFC 6891 6.2.5, smaller advertised sizes are treated as 512
+COOKIE_OPTION = 10  # EDNS0 COOKIE option (RFC 7873)
+OPTION_HEADER_LENGTH = 4
 
 DNS_METHODS = {
     "QUERY": 0,
@@ -67,24 +74,67 @@ def get_random_domain() -> bytes:
     )
 
 
+def build_labels(data: bytes) -> bytes:
+    """Splits data into length prefixed DNS labels of up to MAX_LABEL_LENGTH bytes
+    I.E: b"abc" becomes b"\x03abc"
+
+    Args:
+        data: The raw data to split into labels
+
+    Returns:
+        The labels as a single byte string
+    """
+    return b"".join(
+        [
+            b"".join(
+                [
+                    len(data[i : i + MAX_LABEL_LENGTH]).to_bytes(
+                        length=1, byteorder="big"
+                    ),
+                    data[i : i + MAX_LABEL_LENGTH],
+                ]
+            )
+            for i in range(0, len(data), MAX_LABEL_LENGTH)
+        ]
+    )
+
+
+def get_name_capacity(suffix: bytes) -> int:
+    """Returns the amount of data that fits in a single query name ending in suffix
+
+    Args:
+        suffix: The domain the name ends in I.E: b"\x03com"
+
+    Returns:
+        The maximum number of data bytes per query name
+    """
+    # every MAX_LABEL_LENGTH bytes of data costs one length byte
+    budget = MAX_NAME_LENGTH - len(suffix) - 1
+    full_labels, remainder = divmod(budget, MAX_LABEL_LENGTH + 1)
+    return full_labels * MAX_LABEL_LENGTH + max(remainder - 1, 0)
+
+
 def build_query_list(
     data: bytes,
     record_type: Literal[
         "A", "AAAA", "CNAME", "MX", "NS", "PTR", "SOA", "TXT", "SRV", "CAA", "ANY"
     ] = "A",
     query_class: Literal["IN", "ANY"] = "IN",
+    suffix: Optional[bytes] = None,
 ) -> list[bytes]:
     """Constructs a list of DNS query packets based on the provided data, record type,
     and query class.
 
+    Each query name packs as many MAX_LABEL_LENGTH labels as fit under
+    MAX_NAME_LENGTH, the first query spells out the suffix and every following
+    query points back to it with a compression pointer.
+
     Args:
         data: The raw data to be included in the DNS query packets. This data
-            will be split into chunks of a maximum length defined by `MAX_RECORD_LENGTH`
+            will be split into chunks of at most `get_name_capacity` bytes
         record_type: The DNS record type to query
         query_class: The DNS query class
-
-        list: A list of DNS query packets in byte format, each containing the
-        trimmed data, a random domain, and the specified record type and query class
+        suffix: The domain every query name ends in, defaults to a random domain
 
     Raises:
         KeyError: If the provided `record_type` or `query_class` is not found in
@@ -93,30 +143,145 @@ def build_query_list(
     Returns:
         list of all queries in byte strings
     """
-    i = 0
+    if suffix is None:
+        suffix = get_random_domain()
+    trailer = b"".join(
+        [
+            DNS_RECORD_TYPES[record_type].to_bytes(length=2, byteorder="big"),
+            DNS_CLASSES[query_class].to_bytes(length=2, byteorder="big"),
+        ]
+    )
+    capacity = get_name_capacity(suffix)
+
     queries = []
-    while i < len(data):
-        trimmed_data = data[i : i + MAX_RECORD_LENGTH]
-        queries.append(
-            b"".join(
-                [
-                    b"".join(
-                        [
-                            len(trimmed_data).to_bytes(length=1, byteorder="big"),
-                            trimmed_data,
-                            get_random_domain(),
-                            b"\x00",
-                        ]
-                    ),
-                    DNS_RECORD_TYPES[record_type].to_bytes(length=2, byteorder="big"),
-                    DNS_CLASSES[query_class].to_bytes(length=2, byteorder="big"),
-                ]
+    suffix_pointer = None
+    for i in range(0, len(data), capacity):
+        labels = build_labels(data[i : i + capacity])
+        if suffix_pointer is None:
+            # the first query is placed directly after the header
+            suffix_pointer = (POINTER_FLAG | (HEADER_LENGTH + len(labels))).to_bytes(
+                length=2, byteorder="big"
             )
-        )
-        i += MAX_RECORD_LENGTH
+            queries.append(b"".join([labels, suffix, b"\x00", trailer]))
+        else:
+            queries.append(b"".join([labels, suffix_pointer, trailer]))
     return queries
 
 
+def build_opt_record(udp_size: int) -> bytes:
+    """Builds an EDNS0 OPT pseudo record advertising the given UDP payload size
+
+    Args:
+        udp_size: The maximum UDP payload size to advertise
+
+    Returns:
+        The OPT record as a byte string
+    """
+    return b"".join(
+        [
+            b"\x00",  # root domain
+            OPT_RECORD_TYPE.to_bytes(2, byteorder="big"),
+            udp_size.to_bytes(2, byteorder="big"),  # replaces the class field
+            b"\x00\x00\x00\x00",  # extended rcode, version and flags
+            b"\x00\x00",  # no options
+        ]
+    )
+
+
+def add_cookie_option(packet: bytes | memoryview, cookie_length: int) -> bytes:
+    """Adds the header of an EDNS0 COOKIE option to a query built by
+    assemble_dns_packet, the caller appends the cookie_length byte client cookie.
+    An OPT record is added if the query does not carry one
+
+    Args:
+        packet: The assembled query
+        cookie_length: The length of the client cookie in bytes
+
+    Returns:
+        The query ending in the COOKIE option header
+    """
+    option_header = b"".join(
+        [
+            COOKIE_OPTION.to_bytes(2, byteorder="big"),
+            cookie_length.to_bytes(2, byteorder="big"),
+        ]
+    )
+    options_length = (OPTION_HEADER_LENGTH + cookie_length).to_bytes(2, byteorder="big")
+    if packet[10:12] == b"\x00\x00":
+        return b"".join(
+            [
+                packet[:10],
+                b"\x00\x01",  # one additional record
+                packet[12:],
+                build_opt_record(MIN_UDP_SIZE)[:-2],
+                options_length,
+                option_header,
+            ]
+        )
+    # the OPT record of assemble_dns_packet ends the query without any options
+    return b"".join([packet[:-2], options_length, option_header])
+
+
+def split_cookie_option(
+    packet: bytes | memoryview, cookie_length: int
+) -> Optional[tuple[bytes | memoryview, bytes | memoryview]]:
+    """Splits a query ending in the COOKIE option added by add_cookie_option
+
+    Args:
+        packet: The received query
+        cookie_length: The length of the client cookie in bytes
+
+    Returns:
+        The query up to the cookie and the cookie as a tuple or None if the query
+            does not end in a COOKIE option of that length
+    """
+    cookie_start = len(packet) - cookie_length
+    option_start = cookie_start - OPTION_HEADER_LENGTH
+    if option_start - 2 < HEADER_LENGTH:
+        return None
+    options_length = int.from_bytes(
+        packet[option_start - 2 : option_start], byteorder="big"
+    )
+    option_code = int.from_bytes(
+        packet[option_start : option_start + 2], byteorder="big"
+    )
+    option_length = int.from_bytes(
+        packet[option_start + 2 : cookie_start], byteorder="big"
+    )
+    if (
+        options_length != OPTION_HEADER_LENGTH + cookie_length
+        or option_code != COOKIE_OPTION
+        or option_length != cookie_length
+    ):
+        return None
+    return packet[:cookie_start], packet[cookie_start:]
+
+
+def extract_name_data(name: bytes) -> bytes:
+    """Extracts the data labels from a query name built by build_query_list
+
+    Args:
+        name: The raw query name including the suffix or a compression pointer
+
+    Returns:
+        The data stored in the query name
+    """
+    labels = []
+    off = 0
+    while off < len(name):
+        label_length = name[off]
+        if label_length & 0xC0:
+            # every label before a pointer to the suffix carries data
+            break
+        if label_length == 0:
+            # the final label is the suffix itself
+            labels = labels[:-1]
+            break
+        labels.append(name[off + 1 : off + 1 + label_length])
+        off += label_length + 1
+    return b"".join(labels)
+
+
 def build_body(
     method: Literal["QUERY", "RESPONSE"],
     queries: list[bytes] = None,
@@ -168,17 +333,45 @@ def build_body(
     )
 
 
-def assemble_dns_packet(data: bytes) -> bytes:
+def assemble_dns_packet(data: bytes, edns_size: int = 0) -> bytes:
     """Assembles a DNS packet from the provided data
 
     Args:
         data: The raw data to be included in the DNS packet
+        edns_size: The UDP payload size to advertise in an EDNS0 OPT record,
+            0 omits the record
 
     Returns:
         The assembled DNS packet in byte format.
     """
     queries = build_query_list(data=data)
-    return build_body(method="QUERY", queries=queries)
+    return build_body(
+        method="QUERY",
+        queries=queries,
+        additional_records=[build_opt_record(edns_size)] if edns_size else None,
+    )
+
+
+def is_tunnel_query(packet_bytes: bytes | memoryview) -> bool:
+    """Checks the fixed header fields of a DNS packet built by assemble_dns_packet
+    without parsing the rest of the packet
+
+    Args:
+        packet_bytes: The raw bytes of the received packet
+
+    Returns:
+        True if the header matches a query that carries data
+    """
+    if len(packet_bytes) < HEADER_LENGTH:
+        return False
+    flags = int.from_bytes(packet_bytes[2:4], byteorder="big")
+    question_count = int.from_bytes(packet_bytes[4:6], byteorder="big")
+    # queries built by the tunnel never carry answer or authority records
+    return (
+        flags == DNS_METHODS["QUERY"]
+        and question_count > 0
+        and packet_bytes[6:10] == b"\x00\x00\x00\x00"
+    )
 
 
 def disassemble_dns_packet(packet_bytes: bytes) -> Optional[bytes]:
@@ -196,8 +389,4 @@ def disassemble_dns_packet(packet_bytes: bytes) -> Optional[bytes]:
     except DissectException as e:
         logger.error(f"[disassembler] {e}")
         return None
-    data = b""
-    for query in dns_packet.queries:
-        data_len = int(query.name[0])
-        data += query.name[1 : data_len + 1]
-    return data
+    return b"".join([extract_name_data(query.name) for query in dns_packet.queries])
@@ -0,0 +1,131 @@
+"""Query holding for the downstream direction, the server mode instance holds the polls
+sent by the client mode instance and answers them as soon as downstream data is queued
+"""
+
+# Standard libraries
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+# Third-party libraries
+from loguru import logger
+
+# Project libraries
+from src.framing import FRAME_POLL, build_frame
+
+
+class PollQueue:
+    """Defines the PollQueue class which holds the source addresses of up to hold
+    packets received from the client mode instance. Each held poll is answered by at
+    most one downstream packet and expires after timeout seconds, I.E: when a DNS
+    resolver stops waiting for the answer"""
+
+    def __init__(self, hold: int, timeout: float):
+        self.hold = hold
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # the oldest poll is dropped once more than hold polls are waiting
+        self.polls: deque[tuple[float, tuple[str, int]]] = deque(maxlen=hold)
+
+    def add(self, address: tuple[str, int]):
+        """Holds a poll received from an address
+
+        Args:
+            address: The source address of the received packet
+        """
+        with self.lock:
+            self.polls.append((time.monotonic(), address))
+
+    def take(self) -> Optional[tuple[str, int]]:
+        """Returns the address to answer, the oldest poll that has not expired is
+        answered first
+
+        Returns:
+            The address of the poll or None if no poll is held
+        """
+        with self.lock:
+            deadline = time.monotonic() - self.timeout
+            while self.polls and self.polls[0][0] < deadline:
+                self.polls.popleft()
+            if self.polls:
+                return self.polls.popleft()[1]
+            return None
+
+
+class Poller:
+    """Defines the Poller class which keeps hold polls outstanding at the server mode
+    instance. Answered polls are replaced immediately, otherwise a fresh poll is sent
+    every interval which doubles up to max_interval while no downstream data arrives"""
+
+    def __init__(
+        self,
+        hold: int,
+        interval: float,
+        max_interval: float,
+        timeout: float,
+        send_poll: Callable[[bytes], None],
+    ):
+        self.hold = hold
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.send_poll = send_poll
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.outstanding: deque[float] = deque(maxlen=hold)
+        self.current_interval = interval
+
+    def handle_data(self):
+        """Counts a poll as answered when downstream data arrives and wakes the poll
+        service to replace it"""
+        with self.lock:
+            if self.outstanding:
+                self.outstanding.popleft()
+        self.wake.set()
+
+    def top_up(self, minimum: int) -> int:
+        """Returns the number of polls to send so hold polls are outstanding
+
+        Args:
+            minimum: The number of polls to send even if enough are outstanding
+
+        Returns:
+            The number of polls to send
+        """
+        now = time.monotonic()
+        with self.lock:
+            while self.outstanding and self.outstanding[0] < now - self.timeout:
+                self.outstanding.popleft()
+            count = max(self.hold - len(self.outstanding), minimum)
+            self.outstanding.extend([now] * count)
+        return count
+
+    def poll_service(self):
+        """Starts the poll service, this keeps the pool of polls topped up"""
+        logger.info(
+            f"[poll] Started poller, holding {self.hold} polls every "
+            f"{self.interval}s to {self.max_interval}s"
+        )
+        poll = build_frame(FRAME_POLL, b"")
+        # refresh at least one poll per interval, the server drops its oldest poll
+        minimum = 1
+        while True:
+            count = self.top_up(minimum=minimum)
+            for _ in range(count):
+                self.send_poll(poll)
+            logger.trace(
+                "[poll] Sent {} poll(s), next in {:.3f}s", count, self.current_interval
+            )
+
+            if self.wake.wait(timeout=self.current_interval):
+                # downstream data is flowing, replace the answered polls right away
+                self.wake.clear()
+                self.current_interval = self.interval
+                minimum = 0
+            else:
+                # back off while the tunnel is idle
+                self.current_interval = min(
+                    self.current_interval * 2, self.max_interval
+                )
+                minimum = 1
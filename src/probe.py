@@ -0,0 +1,180 @@
+"""In-band probing of the tunnel path to measure round trip time, jitter and loss"""
+
+# Standard libraries
+import threading
+import time
+from typing import Callable, Optional
+
+# Third-party libraries
+from loguru import logger
+
+# Project libraries
+from src.framing import FRAME_PROBE, FRAME_PROBE_REPLY, build_frame
+
+PROBE_LENGTH = 12  # 4 byte sequence number and 8 byte send timestamp
+RTT_GAIN = 1 / 8  # RFC 6298 smoothing factors
+JITTER_GAIN = 1 / 16  # RFC 3550 A.8
+LOSS_GAIN = 1 / 8
+MIN_PROBE_TIMEOUT = 1.0  # seconds before an unanswered probe is counted as lost
+STATS_INTERVAL = 10.0  # seconds between path statistics log messages
+
+
+def build_probe(sequence: int, timestamp: int) -> bytes:
+    """Builds a probe frame
+
+    Args:
+        sequence: The probe sequence number
+        timestamp: The time.monotonic_ns() the probe was sent at
+
+    Returns:
+        The probe frame
+    """
+    return build_frame(
+        FRAME_PROBE,
+        b"".join(
+            [
+                sequence.to_bytes(length=4, byteorder="big"),
+                timestamp.to_bytes(length=8, byteorder="big"),
+            ]
+        ),
+    )
+
+
+def build_probe_reply(probe_payload: bytes | memoryview) -> Optional[bytes]:
+    """Builds the reply to a probe, echoing its sequence number and timestamp
+
+    Args:
+        probe_payload: The payload of the received probe frame
+
+    Returns:
+        The reply frame or None if the probe is malformed
+    """
+    if len(probe_payload) != PROBE_LENGTH:
+        return None
+    return build_frame(FRAME_PROBE_REPLY, probe_payload)
+
+
+class PathProber:
+    """Defines the PathProber class which sends timestamped probes through the tunnel
+    and keeps exponentially weighted moving averages of the RTT, jitter and loss.
+    on_update is called with the smoothed loss whenever probes are resolved so other
+    stages can adapt, I.E: Pacer.set_loss"""
+
+    def __init__(
+        self,
+        interval: float,
+        send_probe: Callable[[bytes], None],
+        on_update: Optional[Callable[[float], None]] = None,
+    ):
+        self.interval = interval
+        self.send_probe = send_probe
+        self.on_update = on_update
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.outstanding: dict[int, int] = {}
+
+        self.rtt: Optional[float] = None
+        self.rtt_variance = 0.0
+        self.jitter = 0.0
+        self.loss = 0.0
+        self.probes_sent = 0
+        self.probes_lost = 0
+
+    def get_timeout(self) -> float:
+        """Returns the number of seconds after which a probe is counted as lost
+
+        Returns:
+            The probe timeout in seconds
+        """
+        if self.rtt is None:
+            return MIN_PROBE_TIMEOUT
+        return max(self.rtt + 4 * self.rtt_variance, MIN_PROBE_TIMEOUT)
+
+    def stats(self) -> dict[str, float]:
+        """Returns the current path statistics
+
+        Returns:
+            The smoothed RTT and jitter in seconds and the smoothed loss ratio
+        """
+        with self.lock:
+            return {
+                "rtt": self.rtt if self.rtt is not None else 0.0,
+                "jitter": self.jitter,
+                "loss": self.loss,
+                "probes_sent": self.probes_sent,
+                "probes_lost": self.probes_lost,
+            }
+
+    def handle_reply(self, payload: bytes | memoryview):
+        """Updates the path statistics from a probe reply
+
+        Args:
+            payload: The payload of the probe reply frame
+        """
+        if len(payload) != PROBE_LENGTH:
+            return
+        sequence = int.from_bytes(payload[:4], byteorder="big")
+        with self.lock:
+            if (sent_at := self.outstanding.pop(sequence, None)) is None:
+                # late reply for a probe that was already counted as lost
+                return
+            sample = (time.monotonic_ns() - sent_at) / 1_000_000_000
+            if self.rtt is None:
+                self.rtt = sample
+                self.rtt_variance = sample / 2
+            else:
+                self.jitter += JITTER_GAIN * (abs(sample - self.rtt) - self.jitter)
+                self.rtt_variance += (
+                    RTT_GAIN * 2 * (abs(sample - self.rtt) - self.rtt_variance)
+                )
+                self.rtt += RTT_GAIN * (sample - self.rtt)
+            self.loss -= LOSS_GAIN * self.loss
+            loss = self.loss
+        logger.trace(
+            "[probe] Probe {} answered after {:.1f}ms", sequence, sample * 1000
+        )
+        if self.on_update is not None:
+            self.on_update(loss)
+
+    def expire_probes(self):
+        """Counts the probes that exceeded the probe timeout as lost"""
+        deadline = time.monotonic_ns() - int(self.get_timeout() * 1_000_000_000)
+        with self.lock:
+            expired = [
+                sequence
+                for sequence, sent_at in self.outstanding.items()
+                if sent_at < deadline
+            ]
+            for sequence in expired:
+                del self.outstanding[sequence]
+                self.loss += LOSS_GAIN * (1 - self.loss)
+            self.probes_lost += len(expired)
+            loss = self.loss
+        if expired and self.on_update is not None:
+            self.on_update(loss)
+
+    def probe_service(self):
+        """Starts the probe service, this sends a probe every interval and periodically
+        logs the path statistics"""
+        logger.info(f"[probe] Started path prober, probing every {self.interval}s")
+        last_stats = time.monotonic()
+        while True:
+            self.expire_probes()
+            with self.lock:
+                sequence = self.sequence
+                self.sequence = (self.sequence + 1) % 2**32
+                timestamp = time.monotonic_ns()
+                self.outstanding[sequence] = timestamp
+                self.probes_sent += 1
+            self.send_probe(build_probe(sequence=sequence, timestamp=timestamp))
+
+            if time.monotonic() - last_stats >= STATS_INTERVAL:
+                stats = self.stats()
+                logger.info(
+                    f"[probe] rtt {stats['rtt'] * 1000:.1f}ms "
+                    f"jitter {stats['jitter'] * 1000:.1f}ms "
+                    f"loss {stats['loss']:.1%} "
+                    f"({stats['probes_lost']}/{stats['probes_sent']} probes lost)"
+                )
+                last_stats = time.monotonic()
+            time.sleep(self.interval)
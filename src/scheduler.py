@@ -0,0 +1,114 @@
+"""Transmit scheduler that decides the order in which spooled packets are sent"""
+
+# Standard libraries
+import os
+
+
+def get_flow(packet_name: str) -> str:
+    """Returns the flow a spooled packet belongs to
+    I.E: "20250620100000472991_0-127.0.0.1-40000.bin" becomes "0-127.0.0.1-40000"
+
+    Args:
+        packet_name: The filename of the spooled packet
+
+    Returns:
+        The flow tag of the packet or "default" if the packet is untagged
+    """
+    _, separator, flow = packet_name.removesuffix(".bin").partition("_")
+    return flow if separator else "default"
+
+
+def get_channel(packet_name: str) -> int:
+    """Returns the channel a spooled packet belongs to, flows start with the channel id
+    I.E: "20250620100000472991_3-127.0.0.1-40000.bin" becomes 3
+
+    Args:
+        packet_name: The filename of the spooled packet
+
+    Returns:
+        The channel id or 0 if the packet is untagged
+    """
+    channel = get_flow(packet_name).partition("-")[0]
+    return int(channel) if channel.isdigit() else 0
+
+
+class TransmitScheduler:
+    """Defines the TransmitScheduler class which orders the spooled packets of a
+    transmitter so a bulk flow can't starve small interactive packets"""
+
+    def __init__(self, mode: str, quantum: int, priority_size: int):
+        self.mode = mode
+        self.quantum = quantum
+        self.priority_size = priority_size
+        self.deficits: dict[str, int] = {}
+
+    def schedule(self, packets: list[os.DirEntry]) -> list[os.DirEntry]:
+        """Returns the packets to transmit during this pass in transmit order
+
+        fifo sends every packet oldest to newest, priority sends packets of at most
+        priority_size bytes before the rest, and drr sends small packets first
+        followed by one deficit round robin round across the remaining flows. Packets
+        that are not returned are picked up again on the next pass.
+
+        Args:
+            packets: The spooled packets sorted from oldest to newest
+
+        Raises:
+            KeyError: Raises an error if the scheduler has an invalid mode
+
+        Returns:
+            The packets to transmit in order
+        """
+        if self.mode == "fifo":
+            return packets
+
+        small = []
+        bulk = []
+        for packet in packets:
+            try:
+                size = packet.stat().st_size
+            except FileNotFoundError:
+                continue
+            if size <= self.priority_size:
+                small.append(packet)
+            else:
+                bulk.append((packet, size))
+
+        match self.mode:
+            case "priority":
+                return small + [packet for packet, _ in bulk]
+            case "drr":
+                return small + self.deficit_round_robin(bulk)
+            case _:
+                raise KeyError(f"Invalid scheduler mode {self.mode}")
+
+    def deficit_round_robin(
+        self, packets: list[tuple[os.DirEntry, int]]
+    ) -> list[os.DirEntry]:
+        """Runs one deficit round robin round across the flows of the given packets
+
+        Args:
+            packets: The (packet, size) tuples sorted from oldest to newest
+
+        Returns:
+            The packets each flow is allowed to send this round
+        """
+        flows: dict[str, list[tuple[os.DirEntry, int]]] = {}
+        for packet, size in packets:
+            flows.setdefault(get_flow(packet.name), []).append((packet, size))
+
+        round_packets = []
+        for flow, queue in flows.items():
+            deficit = self.deficits.get(flow, 0) + self.quantum
+            sent = 0
+            while sent < len(queue) and queue[sent][1] <= deficit:
+                deficit -= queue[sent][1]
+                round_packets.append(queue[sent][0])
+                sent += 1
+            # an emptied flow does not keep its deficit
+            self.deficits[flow] = deficit if sent < len(queue) else 0
+
+        # forget idle flows
+        for flow in self.deficits.keys() - flows.keys():
+            del self.deficits[flow]
+        return round_packets
@@ -1,7 +1,6 @@
 """Connector class for transmitting data to the client node"""
 
 # Standard libraries
-import os
 import socket
 from typing import Optional
 
@@ -10,9 +9,11 @@ from attrs import define
 from loguru import logger
 
 # Project libraries
-import src.default as df
-from src.base_connector import BaseConnector
+from src.base_connector import BaseConnector, DatagramSocket
+from src.buffer_pool import BufferPool
 from src.load_config import ServerConfig
+from src.pacer import create_pacer
+from src.scheduler import TransmitScheduler
 
 
 @define
@@ -20,66 +21,94 @@ class ServerConnector(BaseConnector):
     """Defines the ServerConnector class to listen for ClientConnector objects
     or other client software I.E: OpenVPN client"""
 
-    def __init__(self, config: ServerConfig):
+    def __init__(
+        self,
+        config: ServerConfig,
+        sock: Optional[DatagramSocket] = None,
+        channel: Optional[int] = None,
+    ):
         self.connector_type = "server"
         self.endpoint = config.endpoint
         self.port = config.port
         self.tx_path = config.tx_path
         self.recv_path = config.recv_path
         self.tx_address = None
+        self.pool = BufferPool()
+        self.capture = None
+        self.channel = channel
+        self.polls = None
+        self.packet_filter = None
+        self.scheduler = TransmitScheduler(
+            mode=config.scheduler,
+            quantum=config.quantum,
+            priority_size=config.priority_size,
+        )
+        self.pacer = create_pacer(
+            packet_rate=config.packet_rate,
+            byte_rate=config.byte_rate,
+            burst=config.burst,
+            adaptive=config.adaptive_pacing,
+            name=self.connector_type,
+        )
 
-        # Create the socket
-        self.sock = socket.socket(
+        # Create the socket unless one is provided I.E: by the network simulator
+        self.sock = sock or socket.socket(
             family=socket.AddressFamily.AF_INET, type=socket.SOCK_DGRAM
         )
+        # the shared listener only receives once the selector reports a datagram
+        self.sock.settimeout(0)
 
-        # Attempt to bind to a specific port
-        self.sock.bind((self.endpoint, self.port))
+        # Attempt to bind to a specific port unless the socket is already bound,
+        # I.E: handed over by the previous process
+        bound_address = self.sock.getsockname()
+        if not bound_address or bound_address[1] == 0:
+            self.sock.bind((self.endpoint, self.port))
 
-    def send_to(self, data: bytes) -> Optional[int]:
+    def send_to(
+        self, data: bytes | memoryview, address: Optional[tuple[str, int]] = None
+    ) -> Optional[int]:
         """Transmits a byte string to the stored tx_address
 
         Args:
             data: The byte string to transmit
+            address: Transmits to this address instead, I.E: a held poll
 
         Returns:
             The number of bytes transmitted or None if the
                 transmission failed
         """
         try:
-            return self.sock.sendto(data, self.tx_address)
+            return self.sock.sendto(data, address or self.tx_address)
         except ConnectionRefusedError as e:
             logger.error(e)
+        except BlockingIOError:
+            logger.error(f"[{self.connector_type}] Send buffer full, packet dropped")
         return None
 
-    def transmit_service(self):
-        """Starts the transmit service, this will send all processed packets
-        to the tx_address stored by the listener_service
+    def get_address(self) -> Optional[tuple[str, int]]:
+        """Returns the tx_address stored by the listener or the address of a held
+        poll, packets are held until the client mode instance has polled
+
+        Returns:
+            The address or None if no transmit endpoint or poll is known yet
         """
-        logger.info(
-            f"[{self.connector_type}] Started transmitter from {self.endpoint}:{self.port}"
-        )
-        # wait for a tx_endpoint and tx_port to be listed
-        while self.tx_address is None:
-            continue
-        while True:
-            # grab a list of all packets and sort them oldest to newest
-            packet_list = os.listdir(path=f"{df.CLIENT_DIR}/{self.tx_path}/")
-            packet_list.sort()
-            for packet in packet_list:
-                packet_path = f"{df.CLIENT_DIR}/{self.tx_path}/{packet}"
-                with open(file=packet_path, mode="rb") as file:
-                    packet_bytes = file.read()
+        if self.polls is not None:
+            return self.polls.take()
+        return self.tx_address
+
+    def transmit(self, data: bytes | memoryview, address: tuple[str, int]):
+        """Sends a packet whose pacer tokens have already been taken
 
-                logger.info(
-                    f"[{self.connector_type}] Transmitting {len(packet_bytes)} byte packet "
-                    f"{self.tx_path}/{packet} to {self.tx_address[0]}:{self.tx_address[1]}"
-                )
-                logger.trace(f"[{self.connector_type}] {packet_bytes}")
-                self.send_to(data=packet_bytes)
-                try:
-                    os.remove(packet_path)
-                except PermissionError:
-                    logger.error(
-                        f"[{self.connector_type}] Permission denied when attempting to delete {packet_path}"
-                    )
+        Args:
+            data: The packet to transmit
+            address: The address returned by get_address
+        """
+        transmitted = self.send_to(data=data, address=address)
+        if self.pacer is not None:
+            self.pacer.report(sent=1, lost=int(transmitted is None))
+        if self.capture is not None:
+            self.capture.write(
+                payload=data,
+                source=self.sock.getsockname(),
+                destination=address,
+            )
@@ -0,0 +1,340 @@
+"""In-process network simulator that can replace the connector sockets to run the
+tunnel pipeline without touching the network. The link impairments are seeded, the
+services using the sockets still run in wall-clock time"""
+
+# Standard libraries
+import heapq
+import itertools
+import random
+import socket
+import threading
+import time
+import zlib
+from typing import Optional
+
+# Third-party libraries
+from attrs import define, field, validators
+
+# Project libraries
+import src.default as df
+
+EPHEMERAL_PORTS = 49152
+
+
+@define
+class LinkProfile:
+    """Defines the LinkProfile class which describes the conditions of a simulated link
+    in simulated seconds"""
+
+    bandwidth: float = field(default=0, converter=float, validator=validators.ge(0))
+    delay: float = field(default=0, converter=float, validator=validators.ge(0))
+    jitter: float = field(default=0, converter=float, validator=validators.ge(0))
+    loss: float = field(
+        default=0,
+        converter=float,
+        validator=validators.and_(validators.ge(0), validators.le(1)),
+    )
+    reorder: float = field(
+        default=0,
+        converter=float,
+        validator=validators.and_(validators.ge(0), validators.le(1)),
+    )
+
+
+class SimulatedClock:
+    """Defines the SimulatedClock class, simulated time runs time_scale times faster
+    than real time"""
+
+    def __init__(self, time_scale: float = 1.0):
+        self.time_scale = time_scale
+        self.start = time.monotonic()
+
+    def now(self) -> float:
+        """Returns the simulated seconds since the clock was created"""
+        return (time.monotonic() - self.start) * self.time_scale
+
+    def to_real(self, duration: float) -> float:
+        """Converts a simulated duration to real seconds"""
+        return duration / self.time_scale
+
+
+class SimulatedLink:
+    """Defines the SimulatedLink class, one direction between two hosts with its own
+    seeded random number generator so its loss and delay pattern only depends on the
+    order of the datagrams sent over it"""
+
+    def __init__(self, profile: LinkProfile, seed: int):
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.busy_until = 0.0
+
+    def get_delivery_time(self, now: float, size: int) -> Optional[float]:
+        """Returns when a datagram sent now arrives or None if the datagram is lost
+
+        Args:
+            now: The simulated send time
+            size: The size of the datagram in bytes
+
+        Returns:
+            The simulated delivery time or None
+        """
+        # draw every random value for every datagram so the sequence stays aligned
+        lost = self.random.random() < self.profile.loss
+        reordered = self.random.random() < self.profile.reorder
+        jitter = self.random.uniform(-self.profile.jitter, self.profile.jitter)
+
+        if self.profile.bandwidth > 0:
+            self.busy_until = max(self.busy_until, now) + size / self.profile.bandwidth
+        else:
+            self.busy_until = now
+        if lost:
+            return None
+        if reordered:
+            # like netem, a reordered datagram skips the queueing delay
+            return self.busy_until
+        return self.busy_until + max(self.profile.delay + jitter, 0)
+
+
+class SimulatedNetwork:
+    """Defines the SimulatedNetwork class which routes datagrams between
+    SimulatedSocket objects, impairing every datagram sent from or to an impaired host
+    """
+
+    def __init__(self, seed: int = 0, time_scale: float = 1.0):
+        self.seed = seed
+        self.clock = SimulatedClock(time_scale=time_scale)
+        self.condition = threading.Condition()
+        self.sockets: dict[tuple[str, int], "SimulatedSocket"] = {}
+        self.profiles: dict[str, LinkProfile] = {}
+        self.links: dict[tuple[str, str], SimulatedLink] = {}
+        self.ports = itertools.count(EPHEMERAL_PORTS)
+        self.sequence = itertools.count()
+        self.sent = 0
+        self.dropped = 0
+        # readiness signals of sockets watched by a selector, I.E: the shared listener
+        self.deliveries: list[tuple[float, int, "SimulatedSocket"]] = []
+        self.delivery_thread: Optional[threading.Thread] = None
+
+    def impair(self, host: str, profile: LinkProfile):
+        """Applies a link profile to every datagram sent from or to a host
+
+        Args:
+            host: The simulated IPv4 address
+            profile: The conditions of the links to and from the host
+        """
+        self.profiles[host] = profile
+
+    def socket(self) -> "SimulatedSocket":
+        """Creates a socket attached to this network
+
+        Returns:
+            An unbound SimulatedSocket
+        """
+        return SimulatedSocket(network=self)
+
+    def get_link(self, source: str, destination: str) -> Optional[SimulatedLink]:
+        """Returns the impaired link between two hosts or None if the link is ideal"""
+        profile = self.profiles.get(destination) or self.profiles.get(source)
+        if profile is None:
+            return None
+        if (source, destination) not in self.links:
+            # derive a stable per-link seed from the network seed and the hosts
+            self.links[(source, destination)] = SimulatedLink(
+                profile=profile,
+                seed=zlib.crc32(f"{self.seed}/{source}/{destination}".encode()),
+            )
+        return self.links[(source, destination)]
+
+    def transmit(
+        self, data: bytes, source: tuple[str, int], destination: tuple[str, int]
+    ):
+        """Schedules the delivery of a datagram
+
+        Args:
+            data: The datagram payload
+            source: The address of the sending socket
+            destination: The address to deliver the datagram to
+        """
+        with self.condition:
+            self.sent += 1
+            now = self.clock.now()
+            if (link := self.get_link(source[0], destination[0])) is not None:
+                delivery_time = link.get_delivery_time(now=now, size=len(data))
+            else:
+                delivery_time = now
+            receiver = self.sockets.get(destination)
+            if delivery_time is None or receiver is None:
+                # lost on the link or nothing is listening, UDP drops it silently
+                self.dropped += 1
+                return
+            sequence = next(self.sequence)
+            heapq.heappush(receiver.inbox, (delivery_time, sequence, data, source))
+            if receiver.reader is not None:
+                heapq.heappush(self.deliveries, (delivery_time, sequence, receiver))
+            self.condition.notify_all()
+
+    def delivery_service(self):
+        """Marks the selectable sockets readable once their datagrams are delivered"""
+        with self.condition:
+            while True:
+                now = self.clock.now()
+                while self.deliveries and self.deliveries[0][0] <= now:
+                    heapq.heappop(self.deliveries)[2].signal()
+                timeout = (
+                    self.clock.to_real(self.deliveries[0][0] - now)
+                    if self.deliveries
+                    else None
+                )
+                self.condition.wait(timeout=timeout)
+
+    def start_delivery(self):
+        """Starts the delivery thread the first time a socket is made selectable"""
+        with self.condition:
+            if self.delivery_thread is None:
+                self.delivery_thread = threading.Thread(
+                    target=self.delivery_service, daemon=True
+                )
+                self.delivery_thread.start()
+
+
+class SimulatedSocket:
+    """Defines the SimulatedSocket class which implements the subset of the
+    socket.socket UDP interface used by the connectors. fileno returns a socketpair
+    that becomes readable whenever a datagram is delivered so the socket can be
+    watched by a selector"""
+
+    def __init__(self, network: SimulatedNetwork):
+        self.network = network
+        self.address: Optional[tuple[str, int]] = None
+        self.peer: Optional[tuple[str, int]] = None
+        self.inbox: list[tuple[float, int, bytes, tuple[str, int]]] = []
+        self.timeout: Optional[float] = None
+        self.reader: Optional[socket.socket] = None
+        self.writer: Optional[socket.socket] = None
+
+    def fileno(self) -> int:
+        """Returns the file descriptor that is readable while a datagram is waiting"""
+        with self.network.condition:
+            if self.reader is None:
+                self.reader, self.writer = socket.socketpair()
+                self.reader.setblocking(False)
+                self.writer.setblocking(False)
+                # datagrams queued before the socket became selectable
+                for delivery_time, sequence, _, _ in self.inbox:
+                    heapq.heappush(
+                        self.network.deliveries, (delivery_time, sequence, self)
+                    )
+                self.network.condition.notify_all()
+        self.network.start_delivery()
+        return self.reader.fileno()
+
+    def signal(self):
+        """Makes the file descriptor readable for one delivered datagram"""
+        try:
+            self.writer.send(b"\x00")
+        except BlockingIOError:
+            # the reader is already readable
+            pass
+
+    def clear_signals(self):
+        """Empties the file descriptor once no datagram is waiting"""
+        if self.reader is None:
+            return
+        try:
+            while self.reader.recv(4096):
+                continue
+        except BlockingIOError:
+            pass
+
+    def bind(self, address: tuple[str, int]):
+        """Attaches the socket to an address on the simulated network"""
+        with self.network.condition:
+            if address[1] == 0:
+                address = (address[0], next(self.network.ports))
+            if address in self.network.sockets:
+                raise OSError(f"Address already in use {address[0]}:{address[1]}")
+            self.address = address
+            self.network.sockets[address] = self
+
+    def settimeout(self, timeout: Optional[float]):
+        """Sets the number of real seconds recvfrom_into waits for a datagram, 0 makes
+        the socket non-blocking"""
+        self.timeout = timeout
+
+    def connect(self, address: tuple[str, int]):
+        """Sets the default destination, binding to an ephemeral port if needed"""
+        if self.address is None:
+            self.bind(("127.0.0.1", 0))
+        self.peer = address
+
+    def getsockname(self) -> tuple[str, int]:
+        """Returns the address the socket is bound to"""
+        return self.address
+
+    def getpeername(self) -> tuple[str, int]:
+        """Returns the address the socket is connected to"""
+        return self.peer
+
+    def sendto(self, data: bytes | memoryview, address: tuple[str, int]) -> int:
+        """Sends a datagram to an address"""
+        if self.address is None:
+            self.bind(("127.0.0.1", 0))
+        self.network.transmit(
+            data=bytes(data), source=self.address, destination=address
+        )
+        return len(data)
+
+    def send(self, data: bytes | memoryview) -> int:
+        """Sends a datagram to the connected address"""
+        return self.sendto(data, self.peer)
+
+    def recvfrom_into(self, buffer: bytearray) -> tuple[int, tuple[str, int]]:
+        """Blocks until a datagram has been delivered and copies it into buffer,
+        raises TimeoutError if none is delivered within the socket timeout or
+        BlockingIOError if none is waiting on a non-blocking socket"""
+        network = self.network
+        deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+        with network.condition:
+            while True:
+                now = network.clock.now()
+                if self.inbox and self.inbox[0][0] <= now:
+                    _, _, data, source = heapq.heappop(self.inbox)
+                    break
+                timeout = (
+                    network.clock.to_real(self.inbox[0][0] - now)
+                    if self.inbox
+                    else None
+                )
+                if self.timeout == 0:
+                    # signals left over from datagrams that were received early
+                    self.clear_signals()
+                    raise BlockingIOError("no datagram waiting")
+                if deadline is not None:
+                    if (remaining := deadline - time.monotonic()) <= 0:
+                        raise TimeoutError("timed out")
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                network.condition.wait(timeout=timeout)
+        if self.reader is not None:
+            try:
+                self.reader.recv(1)
+            except BlockingIOError:
+                # the delivery thread has not signalled the datagram yet
+                pass
+        length = min(len(data), len(buffer))
+        buffer[:length] = data[:length]
+        return length, source
+
+    def recvfrom(self, size: int = df.MAX_RECV_BUFFER) -> tuple[bytes, tuple[str, int]]:
+        """Blocks until a datagram has been delivered and returns it"""
+        buffer = bytearray(size)
+        length, source = self.recvfrom_into(buffer)
+        return bytes(buffer[:length]), source
+
+    def close(self):
+        """Detaches the socket from the simulated network"""
+        with self.network.condition:
+            if self.network.sockets.get(self.address) is self:
+                del self.network.sockets[self.address]
+        if self.reader is not None:
+            self.reader.close()
+            self.writer.close()
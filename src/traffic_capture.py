@@ -0,0 +1,199 @@
+"""Reads, replays and records UDP traffic using pcap/pcapng capture files"""
+
+# Standard libraries
+import socket
+import threading
+import time
+from typing import Optional
+
+# Third-party libraries
+from loguru import logger
+from pypacker import pcapng, ppcap
+from pypacker.layer12 import ethernet
+from pypacker.layer3 import ip
+from pypacker.layer4 import udp
+
+PCAPNG_MAGIC = b"\x0a\x0d\x0d\x0a"
+PCAP_BIG_ENDIAN_MAGICS = (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d")
+DLT_RAW = 101
+LINKTYPE_IPV4 = 228
+FLUSH_INTERVAL = 1.0  # seconds between flushes of a recording capture file
+
+LINKTYPE_CLASSES = {
+    **ppcap.PCAPTYPE_CLASS,
+    DLT_RAW: ip.IP,
+    LINKTYPE_IPV4: ip.IP,
+}
+
+
+def parse_udp_payload(
+    frame: bytes, linktype: int, port: Optional[int] = None
+) -> Optional[bytes]:
+    """Extracts the UDP payload from a captured frame
+
+    Args:
+        frame: The captured frame starting at the link layer
+        linktype: The link type of the capture file
+        port: Only return the payload if the source or destination port matches
+
+    Returns:
+        The UDP payload or None if the frame is not a (matching) UDP datagram
+    """
+    if linktype == ppcap.DLT_NULL:
+        # BSD loopback, 4 byte address family followed by the IP header
+        frame, linktype = frame[4:], DLT_RAW
+    if (layer_class := LINKTYPE_CLASSES.get(linktype)) is None:
+        raise KeyError(f"Unsupported capture link type {linktype}")
+    try:
+        datagram = layer_class(frame)[udp.UDP]
+    except Exception:  # pypacker raises plain exceptions on malformed frames
+        return None
+    if datagram is None:
+        return None
+    if port is not None and port not in (datagram.sport, datagram.dport):
+        return None
+    return datagram.body_bytes
+
+
+def read_capture(
+    file_path: str, port: Optional[int] = None
+) -> list[tuple[float, bytes]]:
+    """Reads every UDP payload from a pcap or pcapng file
+
+    Args:
+        file_path: Path to the capture file
+        port: Only return payloads sent from or to this UDP port
+
+    Returns:
+        A list of (seconds since the first packet, payload) tuples
+    """
+    with open(file=file_path, mode="rb") as file:
+        header = file.read(24)
+    is_pcapng = header[:4] == PCAPNG_MAGIC
+
+    packets = []
+    if is_pcapng:
+        reader = pcapng.Reader(filename=file_path)
+        linktype = reader.idbs[0].linktype
+        # pcapng timestamps are returned in seconds
+        frames = (
+            (timestamp, block.body_bytes[: block.cap_len])
+            for timestamp, block in reader
+        )
+    else:
+        reader = ppcap.Reader(filename=file_path)
+        byteorder = "big" if header[:4] in PCAP_BIG_ENDIAN_MAGICS else "little"
+        linktype = int.from_bytes(header[20:24], byteorder=byteorder)
+        # pcap timestamps are returned in nanoseconds
+        frames = ((timestamp / 1_000_000_000, frame) for timestamp, frame in reader)
+
+    start = None
+    for timestamp, frame in frames:
+        if (payload := parse_udp_payload(frame, linktype=linktype, port=port)) is None:
+            continue
+        if start is None:
+            start = timestamp
+        packets.append((timestamp - start, payload))
+    return packets
+
+
+def replay_capture(
+    packets: list[tuple[float, bytes]],
+    endpoint: str,
+    port: int,
+    speed: float = 1.0,
+) -> int:
+    """Sends captured payloads to an endpoint, preserving the original timing
+
+    Args:
+        packets: The (relative timestamp, payload) tuples returned by read_capture
+        endpoint: The address to replay the traffic to I.E: a local ServerConnector
+        port: The port to replay the traffic to
+        speed: Replay speed multiplier, 0 sends every packet as fast as possible
+
+    Returns:
+        The number of bytes transmitted
+    """
+    sock = socket.socket(family=socket.AddressFamily.AF_INET, type=socket.SOCK_DGRAM)
+    sock.connect((endpoint, port))
+    transmitted = 0
+    start = time.perf_counter()
+    for timestamp, payload in packets:
+        if speed > 0:
+            delay = start + timestamp / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        try:
+            transmitted += sock.send(payload)
+        except ConnectionRefusedError:
+            logger.error(f"[replay] Connection refused by {endpoint}:{port}")
+    sock.close()
+    return transmitted
+
+
+class CaptureWriter:
+    """Defines the CaptureWriter class which records transmitted datagrams to a pcap
+    file, wrapping each payload in Ethernet/IPv4/UDP headers. Writes are buffered and
+    flushed at most every FLUSH_INTERVAL seconds, when idle and on close"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.writer = ppcap.Writer(
+            filename=file_path,
+            linktype=ppcap.DLT_EN10MB,
+            snaplen=65535,
+        )
+        self.pending = False
+        self.last_flush = time.monotonic()
+
+    def write(
+        self,
+        payload: bytes | memoryview,
+        source: tuple[str, int],
+        destination: tuple[str, int],
+    ):
+        """Appends a UDP datagram to the capture file
+
+        Args:
+            payload: The UDP payload
+            source: The source IPv4 address and port
+            destination: The destination IPv4 address and port
+        """
+        datagram = udp.UDP(sport=source[1], dport=destination[1])
+        datagram.body_bytes = bytes(payload)
+        frame = (
+            ethernet.Ethernet()
+            + ip.IP(src_s=source[0], dst_s=destination[0], p=ip.IP_PROTO_UDP)
+            + datagram
+        )
+        with self.lock:
+            self.writer.write(frame.bin(), ts=time.time_ns())
+            self.pending = True
+            if (now := time.monotonic()) - self.last_flush >= FLUSH_INTERVAL:
+                self.flush(now)
+
+    def idle(self):
+        """Flushes the buffered datagrams if the interval has elapsed without a new
+        datagram, called by the transmitter when it finds no work"""
+        with self.lock:
+            if self.pending and (
+                (now := time.monotonic()) - self.last_flush >= FLUSH_INTERVAL
+            ):
+                self.flush(now)
+
+    def flush(self, now: float):
+        """Writes the buffered datagrams to the capture file, called with lock held
+
+        Args:
+            now: The current time.monotonic() value
+        """
+        self.writer.flush()
+        self.pending = False
+        self.last_flush = now
+
+    def close(self):
+        """Flushes the buffered datagrams and closes the capture file"""
+        with self.lock:
+            self.writer.close()
+            self.pending = False
@@ -0,0 +1,70 @@
+"""Aggregates per-packet events into periodic log summaries"""
+
+# Standard libraries
+import time
+
+# Third-party libraries
+from loguru import logger
+
+SUMMARY_INTERVAL = 10.0  # seconds between summaries
+
+
+class TrafficCounter:
+    """Defines the TrafficCounter class which counts the packets and bytes handled by a
+    service and logs a summary at most every SUMMARY_INTERVAL seconds, replacing a log
+    message per packet. Each counter is only updated by the thread of its service,
+    which calls idle when it finds no work so the last summary is not held back until
+    the next packet"""
+
+    def __init__(self, name: str, action: str, interval: float = SUMMARY_INTERVAL):
+        self.name = name
+        self.action = action
+        self.interval = interval
+        self.packets = 0
+        self.bytes = 0
+        self.total_packets = 0
+        self.total_bytes = 0
+        self.last_summary = time.monotonic()
+
+    def add(self, size: int):
+        """Counts a packet and logs a summary if the interval has elapsed
+
+        Args:
+            size: The size of the packet in bytes
+        """
+        self.packets += 1
+        self.bytes += size
+        if (now := time.monotonic()) - self.last_summary >= self.interval:
+            self.flush(now)
+
+    def idle(self):
+        """Logs a summary if the interval has elapsed without a new packet"""
+        if (now := time.monotonic()) - self.last_summary < self.interval:
+            return
+        if self.packets > 0:
+            self.flush(now)
+        else:
+            # nothing to report, start the next interval without logging
+            self.last_summary = now
+
+    def flush(self, now: float):
+        """Logs and resets the counts of the current interval
+
+        Args:
+            now: The current time.monotonic() value
+        """
+        elapsed = now - self.last_summary
+        self.total_packets += self.packets
+        self.total_bytes += self.bytes
+        logger.info(
+            "[{}] {} {} packets ({} bytes, {:.1f} packets/s) in the last {:.0f}s",
+            self.name,
+            self.action,
+            self.packets,
+            self.bytes,
+            self.packets / elapsed,
+            elapsed,
+        )
+        self.packets = 0
+        self.bytes = 0
+        self.last_summary = now
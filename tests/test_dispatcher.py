@@ -0,0 +1,83 @@
+"""Tests for the services shared by every tunnel"""
+
+# Standard libraries
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Project libraries
+import src.default as df
+from main import start_tunnel
+from src.dispatcher import Dispatcher
+from src.load_config import TunnelConfig
+from src.simulator import SimulatedNetwork
+
+# a converted, a framed and a relayed tunnel pair share the same four threads
+PACKET_CONFIGS = [
+    {"protocol": "dns", "encoding": "base85"},
+    {"protocol": "dns", "encoding": "base64", "framing": True},
+    {"protocol": "none", "encoding": "none"},
+]
+
+
+def build_pair(index: int, packet: dict) -> list[TunnelConfig]:
+    """Builds a client mode (edge) and server mode (core) tunnel with their own
+    addresses and spools"""
+    edge_port, core_port, service_port = 5000 + index, 5300 + index, 6000 + index
+    edge = {
+        "mode": "client",
+        "client": {"endpoint": "10.0.0.2", "port": core_port},
+        "server": {"endpoint": "127.0.0.1", "port": edge_port},
+        "packet": packet,
+    }
+    core = {
+        "mode": "server",
+        "client": {"endpoint": "127.0.0.2", "port": service_port},
+        "server": {"endpoint": "10.0.0.2", "port": core_port},
+        "packet": packet,
+    }
+    return [
+        TunnelConfig.from_dict(data, name=name, spool_dir=f"tunnels/{name}-{index}")
+        for name, data in (("edge", edge), ("core", core))
+    ]
+
+
+def test_shared_services_serve_every_tunnel(tmp_path, monkeypatch):
+    """Packets of every tunnel make the round trip through a single set of shared
+    service threads"""
+    monkeypatch.setattr(df, "CLIENT_DIR", str(tmp_path))
+    network = SimulatedNetwork(seed=0)
+    dispatcher = Dispatcher()
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+    for index, packet in enumerate(PACKET_CONFIGS):
+        for tunnel in build_pair(index, packet):
+            start_tunnel(
+                config=tunnel,
+                loop=loop,
+                executor=executor,
+                dispatcher=dispatcher,
+                log_name=f"[{tunnel.name}-{index}] ",
+                socket_factory=network.socket,
+            )
+    # the tunnel services are shared, no thread is started per tunnel
+    assert len(dispatcher.services()) == 4
+    for service, name in dispatcher.services():
+        threading.Thread(target=service, name=name, daemon=True).start()
+
+    for index in range(len(PACKET_CONFIGS)):
+        service = network.socket()
+        service.bind(("127.0.0.2", 6000 + index))
+        service.settimeout(5)
+        application = network.socket()
+        application.bind(("127.0.0.3", 7000 + index))
+        application.settimeout(5)
+
+        application.sendto(f"request {index}".encode(), ("127.0.0.1", 5000 + index))
+        data, address = service.recvfrom()
+        assert data == f"request {index}".encode()
+        service.sendto(f"reply {index}".encode(), address)
+        data, _ = application.recvfrom()
+        assert data == f"reply {index}".encode()
+    # the services outlive the test, keep them away from the next test's spool
+    assert dispatcher.pause_services(timeout=2)
@@ -0,0 +1,50 @@
+"""Tests for the DNS packet library"""
+
+# Project libraries
+from src.packet_lib.dns import (
+    add_cookie_option,
+    assemble_dns_packet,
+    disassemble_dns_packet,
+    is_tunnel_query,
+    split_cookie_option,
+)
+
+# a query header with one question followed by the name ~~~~.uk type A class IN
+JUNK_QUERY = (
+    b"\x00\x01\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+    b"\x04~~~~\x02uk\x00\x00\x01\x00\x01"
+)
+
+
+def test_is_tunnel_query_accepts_assembled_queries():
+    """Queries built by assemble_dns_packet pass the header check"""
+    assert is_tunnel_query(assemble_dns_packet(b"data"))
+    assert is_tunnel_query(assemble_dns_packet(b"data", edns_size=1232))
+
+
+def test_is_tunnel_query_rejects_foreign_headers():
+    """Responses, short packets and packets with answers fail the header check"""
+    query = bytearray(assemble_dns_packet(b"data"))
+    assert not is_tunnel_query(bytes(query[:11]))
+    response = bytearray(query)
+    response[2] = 0x81
+    assert not is_tunnel_query(bytes(response))
+    no_question = bytearray(query)
+    no_question[4:6] = b"\x00\x00"
+    assert not is_tunnel_query(bytes(no_question))
+    with_answer = bytearray(query)
+    with_answer[6:8] = b"\x00\x01"
+    assert not is_tunnel_query(bytes(with_answer))
+
+
+def test_cookie_option_round_trip():
+    """The cookie appended after add_cookie_option is split off again and the
+    query still disassembles"""
+    for edns_size in (0, 1232):
+        query = add_cookie_option(assemble_dns_packet(b"data", edns_size), 8)
+        signed, cookie = split_cookie_option(query + b"12345678", 8)
+        assert signed == query
+        assert cookie == b"12345678"
+        assert query[10:12] == b"\x00\x01"
+        assert disassemble_dns_packet(query + b"12345678") == b"data"
+    assert split_cookie_option(JUNK_QUERY, 8) is None
@@ -0,0 +1,117 @@
+"""Tests for the handoff of the connector sockets"""
+
+# Standard libraries
+import os
+import threading
+import time
+
+# Project libraries
+import src.default as df
+from src.dispatcher import Dispatcher
+from src.handoff import HandoffServer
+from src.load_config import ServerConfig
+from src.server import ServerConnector
+from src.simulator import SimulatedNetwork, SimulatedSocket
+
+
+class BlockingSocket(SimulatedSocket):
+    """A simulated socket whose sends block until released"""
+
+    def __init__(self, network: SimulatedNetwork):
+        super().__init__(network=network)
+        self.sending = threading.Event()
+        self.release = threading.Event()
+
+    def sendto(self, data: bytes | memoryview, address: tuple[str, int]) -> int:
+        self.sending.set()
+        self.release.wait()
+        return super().sendto(data, address)
+
+
+def test_paused_listener_leaves_packets_in_the_socket(tmp_path, monkeypatch):
+    """Packets received after the services were paused must not be spooled by this
+    process, they are left in the socket for the next one"""
+    monkeypatch.setattr(df, "CLIENT_DIR", str(tmp_path))
+    monkeypatch.setattr(df, "LISTEN_TIMEOUT", 0.05)
+    network = SimulatedNetwork(seed=0)
+    server = ServerConnector(
+        config=ServerConfig.from_dict(
+            {"endpoint": "10.0.0.1", "port": 5053}, mode="server"
+        ),
+        sock=network.socket(),
+    )
+    spool = tmp_path / server.recv_path
+    os.makedirs(spool)
+    dispatcher = Dispatcher()
+    dispatcher.add_tunnel(log_name="", connectors=[server])
+    for service, _ in dispatcher.services():
+        threading.Thread(target=service, daemon=True).start()
+    sender = network.socket()
+
+    handoff = HandoffServer(
+        path=str(tmp_path / "toa.sock"), connectors={"s": server}, dispatcher=dispatcher
+    )
+    assert handoff.pause_services()
+    sender.sendto(b"in flight", ("10.0.0.1", 5053))
+    time.sleep(0.2)
+    assert os.listdir(spool) == []
+
+    # a failed handoff resumes the listener which spools the waiting packet
+    handoff.resume_services()
+    deadline = time.monotonic() + 2
+    while not os.listdir(spool) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(os.listdir(spool)) == 1
+    # the services outlive the test, keep them away from the next test's spool
+    assert dispatcher.pause_services(timeout=2)
+
+
+def test_pause_waits_for_the_packet_in_flight(tmp_path, monkeypatch):
+    """The transmitter finishes sending its packet before the pause returns and sends
+    nothing else until it is resumed"""
+    monkeypatch.setattr(df, "CLIENT_DIR", str(tmp_path))
+    monkeypatch.setattr(df, "LISTEN_TIMEOUT", 0.05)
+    network = SimulatedNetwork(seed=0)
+    sock = BlockingSocket(network=network)
+    server = ServerConnector(
+        config=ServerConfig.from_dict(
+            {"endpoint": "10.0.0.1", "port": 5053}, mode="server"
+        ),
+        sock=sock,
+    )
+    server.tx_address = ("10.0.0.2", 5053)
+    spool = tmp_path / server.tx_path
+    os.makedirs(spool)
+    df.write_packet_file(path=str(spool / "1_0.bin"), packet=b"in flight")
+    dispatcher = Dispatcher()
+    dispatcher.add_tunnel(log_name="", connectors=[server])
+    for service, _ in dispatcher.services():
+        threading.Thread(target=service, daemon=True).start()
+    assert sock.sending.wait(timeout=2)
+
+    handoff = HandoffServer(
+        path=str(tmp_path / "toa.sock"), connectors={"s": server}, dispatcher=dispatcher
+    )
+    paused = []
+    pause = threading.Thread(target=lambda: paused.append(handoff.pause_services()))
+    pause.start()
+    time.sleep(0.2)
+    assert pause.is_alive()
+
+    sock.release.set()
+    pause.join(timeout=2)
+    assert paused == [True]
+    assert os.listdir(spool) == []
+
+    # a packet spooled while paused is left for the next process
+    df.write_packet_file(path=str(spool / "2_0.bin"), packet=b"queued")
+    dispatcher.transmit.notify()
+    time.sleep(0.2)
+    assert os.listdir(spool) == ["2_0.bin"]
+
+    handoff.resume_services()
+    deadline = time.monotonic() + 2
+    while os.listdir(spool) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert os.listdir(spool) == []
+    assert dispatcher.pause_services(timeout=2)
@@ -0,0 +1,58 @@
+"""Tests for the Pacer"""
+
+# Standard libraries
+import threading
+
+# Project libraries
+import src.pacer as pacer_module
+from src.pacer import DECREASE_FACTOR, Pacer
+
+
+def test_set_loss_replaces_transmitter_reports(monkeypatch):
+    """Once a prober reports the loss, successful sends must not dilute it"""
+    monkeypatch.setattr(pacer_module, "ADAPT_INTERVAL", 0.0)
+    pacer = Pacer(packet_rate=1000, byte_rate=0, burst=1.0, adaptive=True)
+    pacer.set_loss(0.5)
+    for _ in range(1000):
+        pacer.report(sent=1, lost=0)
+    assert pacer.loss == 0.5
+    assert pacer.scale < 1.0
+    assert pacer.packet_bucket.rate == 1000 * pacer.scale
+
+
+def test_report_concurrent_counts_are_not_lost(monkeypatch):
+    """Reports from several transmitter threads must all be counted"""
+    monkeypatch.setattr(pacer_module, "ADAPT_INTERVAL", float("inf"))
+    pacer = Pacer(packet_rate=1000, byte_rate=0, burst=1.0, adaptive=True)
+    threads_count, reports_per_thread = 8, 5000
+
+    def report():
+        for _ in range(reports_per_thread):
+            pacer.report(sent=1, lost=1)
+
+    threads = [threading.Thread(target=report) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pacer.sent == threads_count * reports_per_thread
+    assert pacer.lost == threads_count * reports_per_thread
+
+
+def test_adapt_decreases_on_probed_loss(monkeypatch):
+    """A probed loss above the threshold decreases the rate multiplicatively"""
+    monkeypatch.setattr(pacer_module, "ADAPT_INTERVAL", 0.0)
+    pacer = Pacer(packet_rate=1000, byte_rate=0, burst=1.0, adaptive=True)
+    pacer.set_loss(0.1)
+    assert pacer.scale == DECREASE_FACTOR
+    pacer.set_loss(0.0)
+    assert pacer.scale > DECREASE_FACTOR
+
+
+def test_large_packet_puts_byte_bucket_into_debt():
+    """A packet larger than the byte bucket is sent and delays the next packet"""
+    pacer = Pacer(packet_rate=0, byte_rate=1000, burst=0.1, adaptive=False)
+    assert pacer.byte_bucket.capacity == 100
+    pacer.wait(size=1500)
+    assert pacer.byte_bucket.tokens < 0
+    assert pacer.byte_bucket.delay() > 1.0
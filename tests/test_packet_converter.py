@@ -0,0 +1,191 @@
+"""Tests for the PacketConverter"""
+
+# Standard libraries
+import os
+import sys
+import threading
+
+# Third-party libraries
+import pytest
+
+# Project libraries
+import src.default as df
+from src.framing import FRAME_POLL, build_frame
+from src.load_config import PacketConfig
+from src.packet_converter import PacketConverter
+from src.packet_filter import PacketFilter
+
+# a 25 byte query for ~~~~.uk, it passes the header check but is not valid base85
+JUNK_QUERY = (
+    b"\x00\x01\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+    b"\x04~~~~\x02uk\x00\x00\x01\x00\x01"
+)
+
+
+def test_inject_frame_concurrent_names_are_unique(tmp_path, monkeypatch):
+    """Control frames injected by several threads at once must not share a name"""
+    monkeypatch.setattr(df, "CLIENT_DIR", str(tmp_path))
+    # every frame is injected within the same microsecond
+    monkeypatch.setattr(df, "get_datetime", lambda: "20250620100000472991")
+    converter = PacketConverter(
+        config=PacketConfig.from_dict(
+            {"protocol": "dns", "encoding": "base85", "framing": True},
+            mode="client",
+        )
+    )
+    os.makedirs(tmp_path / converter.assemble_destination)
+    threads_count, frames_per_thread = 8, 200
+    errors = []
+    start = threading.Barrier(threads_count)
+
+    def inject():
+        start.wait()
+        for _ in range(frames_per_thread):
+            try:
+                converter.inject_frame(build_frame(FRAME_POLL, b""))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=inject) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    names = os.listdir(tmp_path / converter.assemble_destination)
+    assert len(names) == threads_count * frames_per_thread
+    assert all(name.endswith("_control.bin") for name in names)
+
+
+def test_undecodable_packet_does_not_end_the_batch():
+    """Junk that passes the header check is dropped without losing the rest of the
+    batch"""
+    converter = PacketConverter(
+        config=PacketConfig.from_dict(
+            {"protocol": "dns", "encoding": "base85", "framing": True},
+            mode="server",
+        )
+    )
+    packet_filter = PacketFilter(protocol="dns", header_check=True)
+    assert packet_filter.check(memoryview(JUNK_QUERY), ("192.0.2.1", 53)) is not None
+    valid = converter.assemble_packet(b"payload")
+    assert converter.disassemble_batch([valid, JUNK_QUERY, valid]) == [
+        (0, b"payload"),
+        (None, None),
+        (0, b"payload"),
+    ]
+
+
+def test_unknown_channel_frames_are_dropped():
+    """Frames for a channel without a local connector are dropped and counted instead
+    of being spooled where no transmitter picks them up"""
+    remote = PacketConverter(
+        config=PacketConfig.from_dict(
+            {"protocol": "dns", "encoding": "base85", "framing": True},
+            mode="client",
+        )
+    )
+    local = PacketConverter(
+        config=PacketConfig.from_dict(
+            {"protocol": "dns", "encoding": "base85", "framing": True},
+            mode="server",
+        )
+    )
+    local.channels |= {1}
+    packets = remote.assemble_batch(
+        packets=[b"zero", b"one", b"seven"], channels=[0, 1, 7]
+    )
+    assert local.disassemble_batch(packets) == [
+        (0, b"zero"),
+        (1, b"one"),
+        (None, None),
+    ]
+    assert local.unknown_channels.packets == 1
+
+
+@pytest.mark.parametrize(
+    "protocol, encoding, framing",
+    [
+        ("dns", "base85", True),
+        ("dns", "base64", False),
+        ("none", "base64", True),
+        ("none", "none", True),
+        ("none", "none", False),
+    ],
+)
+def test_batch_round_trip(protocol, encoding, framing):
+    """Packets assembled as a batch disassemble to the original data and channel"""
+    converter = PacketConverter(
+        config=PacketConfig.from_dict(
+            {"protocol": protocol, "encoding": encoding, "framing": framing},
+            mode="client",
+        )
+    )
+    converter.channels |= {3}
+    packets = [os.urandom(size) for size in (1, 100, 900)]
+    channels = [0, 3, 0] if framing else [0, 0, 0]
+    assembled = converter.assemble_batch(packets=packets, channels=channels)
+    assert [
+        (channel, bytes(data))
+        for channel, data in converter.disassemble_batch(packets=assembled)
+    ] == list(zip(channels, packets))
+
+
+def test_batch_matches_single_packet_api():
+    """assemble_batch and disassemble_batch agree with the per packet methods"""
+    converter = PacketConverter(
+        config=PacketConfig.from_dict(
+            {"protocol": "none", "encoding": "base64", "framing": True},
+            mode="client",
+        )
+    )
+    packets = [b"first", b"second", b""]
+    batch = converter.assemble_batch(packets=packets)
+    assert batch == [converter.assemble_packet(packet) for packet in packets]
+    assert converter.disassemble_batch(packets=batch) == [
+        converter.disassemble_packet(packet) for packet in batch
+    ]
+    assert converter.assemble_batch(packets=[]) == []
+
+
+def test_concurrent_batches_do_not_share_the_scratch_buffer():
+    """Frames built by different threads at once must not overwrite each other"""
+    # switch threads as often as possible so frames are built concurrently
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    converter = PacketConverter(
+        config=PacketConfig.from_dict(
+            {"protocol": "none", "encoding": "base64", "framing": True},
+            mode="client",
+        )
+    )
+    converter.channels |= set(range(8))
+    threads_count, batches_per_thread = 8, 200
+    errors = []
+    start = threading.Barrier(threads_count)
+
+    def assemble(channel: int):
+        packets = [bytes([channel]) * size for size in (10, 500, 1400)]
+        start.wait()
+        for _ in range(batches_per_thread):
+            assembled = converter.assemble_batch(
+                packets=packets, channels=[channel] * len(packets)
+            )
+            if converter.disassemble_batch(packets=assembled) != [
+                (channel, packet) for packet in packets
+            ]:
+                errors.append(channel)
+
+    threads = [
+        threading.Thread(target=assemble, args=(channel,))
+        for channel in range(threads_count)
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert not errors
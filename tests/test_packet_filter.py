@@ -0,0 +1,85 @@
+"""Tests for the PacketFilter"""
+
+# Standard libraries
+import pytest
+
+# Project libraries
+from src.load_config import PacketConfig
+from src.packet_converter import PacketConverter
+from src.packet_filter import PacketFilter
+
+SOURCE = ("192.0.2.1", 40000)
+
+
+def build_converter(protocol: str, key: str, edns_size: int = 0) -> PacketConverter:
+    """Returns a framed converter that signs its packets with key"""
+    converter = PacketConverter(
+        config=PacketConfig.from_dict(
+            {
+                "protocol": protocol,
+                "encoding": "base85",
+                "framing": True,
+                "edns_size": edns_size,
+                "filter_key": key,
+            },
+            mode="client",
+        )
+    )
+    converter.packet_filter = PacketFilter(
+        protocol=protocol, header_check=True, key=key
+    )
+    return converter
+
+
+@pytest.mark.parametrize(
+    "protocol, edns_size", [("dns", 0), ("dns", 1232), ("none", 0)]
+)
+def test_signed_packets_pass_and_disassemble(protocol, edns_size):
+    """Packets signed by the remote assembler pass check and keep their data"""
+    converter = build_converter(protocol, key="secret", edns_size=edns_size)
+    packet_filter = PacketFilter(protocol=protocol, header_check=True, key="secret")
+    converter.channels |= {2}
+    packet = converter.assemble_packet(b"payload", channel=2)
+    checked = packet_filter.check(memoryview(packet), SOURCE)
+    assert checked is not None
+    assert converter.disassemble_batch([checked]) == [(2, b"payload")]
+
+
+@pytest.mark.parametrize("protocol", ["dns", "none"])
+def test_verify_rejects_tampered_and_foreign_packets(protocol):
+    """A flipped bit or a different key fails verification"""
+    packet = build_converter(protocol, key="secret").assemble_packet(b"payload")
+    packet_filter = PacketFilter(protocol=protocol, header_check=False, key="secret")
+    assert packet_filter.verify(memoryview(packet)) is not None
+    for index in range(len(packet)):
+        tampered = bytearray(packet)
+        tampered[index] ^= 0x01
+        assert packet_filter.verify(memoryview(bytes(tampered))) is None
+    other = PacketFilter(protocol=protocol, header_check=False, key="other")
+    assert other.verify(memoryview(packet)) is None
+    assert packet_filter.verify(memoryview(b"")) is None
+
+
+def test_sign_without_key_returns_packet():
+    """Without a key the assembled packet is sent unchanged"""
+    packet_filter = PacketFilter(protocol="dns", header_check=True)
+    assert packet_filter.sign(b"packet") == b"packet"
+
+
+def test_check_drops_junk_and_counts_it():
+    """Packets with a foreign header are dropped and counted"""
+    packet_filter = PacketFilter(protocol="dns", header_check=True)
+    response = b"\x12\x34\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00"
+    assert packet_filter.check(memoryview(response), SOURCE) is None
+    assert packet_filter.check(memoryview(b"\x00"), SOURCE) is None
+    assert packet_filter.counter.packets == 2
+
+
+def test_check_rate_limits_each_source():
+    """A source over its rate is dropped while other sources still pass"""
+    packet_filter = PacketFilter(protocol="none", header_check=True, rate=1, burst=2)
+    passed = [
+        packet_filter.check(memoryview(b"data"), SOURCE) is not None for _ in range(5)
+    ]
+    assert passed == [True, True, False, False, False]
+    assert packet_filter.check(memoryview(b"data"), ("192.0.2.2", 40000)) is not None
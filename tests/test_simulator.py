@@ -0,0 +1,43 @@
+"""Runs the edge <-> core tunnel pipeline through the SimulatedNetwork, the packets are
+sent slowly enough that each link sees them in the same order on every run"""
+
+# Standard libraries
+import json
+import os
+import subprocess
+import sys
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COUNT = 60
+
+
+def simulate(*args: str) -> dict:
+    """Runs simulate.py with a fixed seed and returns its JSON report"""
+    result = subprocess.run(
+        [sys.executable, "simulate.py", "--json", "--seed", "3"]
+        + ["--count", str(COUNT), "--rate", "200", "--delay", "0.005"]
+        + ["--timeout", "3", *args],
+        cwd=REPO_PATH,
+        capture_output=True,
+        text=True,
+        timeout=120,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_lossless_link_delivers_every_packet_in_order():
+    """Every echoed packet arrives once and in the order it was sent"""
+    report = simulate()
+    assert report["link_dropped"] == 0
+    assert report["delivered"] == list(range(COUNT))
+
+
+def test_lossy_link_is_reproducible():
+    """The same seed drops the same packets, the rest still arrive in order"""
+    first = simulate("--loss", "0.2")
+    second = simulate("--loss", "0.2")
+    assert 0 < len(first["delivered"]) < COUNT
+    assert first["delivered"] == sorted(first["delivered"])
+    assert sorted(first["delivered"]) == sorted(second["delivered"])
+    assert first["link_dropped"] == second["link_dropped"]
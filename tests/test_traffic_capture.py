@@ -0,0 +1,50 @@
+"""Tests for the CaptureWriter"""
+
+# Standard libraries
+import os
+from types import SimpleNamespace
+
+# Project libraries
+import src.traffic_capture as traffic_capture
+from src.traffic_capture import CaptureWriter, read_capture
+
+SOURCE = ("10.0.0.1", 5000)
+DESTINATION = ("10.0.0.2", 53)
+
+
+def test_writes_are_buffered_until_idle_flush(tmp_path, monkeypatch):
+    """Datagrams are not flushed per packet but once the interval has elapsed"""
+    now = [100.0]
+    real_time = traffic_capture.time
+    monkeypatch.setattr(
+        traffic_capture,
+        "time",
+        SimpleNamespace(monotonic=lambda: now[0], time_ns=real_time.time_ns),
+    )
+    file_path = str(tmp_path / "capture.pcap")
+    capture = CaptureWriter(file_path=file_path)
+    header_size = os.path.getsize(file_path)
+    for index in range(3):
+        capture.write(
+            payload=bytes([index]) * 10, source=SOURCE, destination=DESTINATION
+        )
+    capture.idle()
+    assert os.path.getsize(file_path) == header_size
+
+    now[0] += traffic_capture.FLUSH_INTERVAL
+    capture.idle()
+    assert os.path.getsize(file_path) > header_size
+    capture.close()
+
+
+def test_close_writes_every_datagram(tmp_path):
+    """Closing the writer flushes the buffered datagrams"""
+    file_path = str(tmp_path / "capture.pcap")
+    capture = CaptureWriter(file_path=file_path)
+    for index in range(5):
+        capture.write(
+            payload=bytes([index]) * 10, source=SOURCE, destination=DESTINATION
+        )
+    capture.close()
+    payloads = [payload for _, payload in read_capture(file_path=file_path, port=53)]
+    assert payloads == [bytes([index]) * 10 for index in range(5)]
@@ -0,0 +1,39 @@
+"""Tests for the TrafficCounter"""
+
+# Standard libraries
+from types import SimpleNamespace
+
+# Third-party libraries
+from loguru import logger
+
+# Project libraries
+import src.traffic_stats as traffic_stats
+from src.traffic_stats import TrafficCounter
+
+
+def test_idle_flushes_pending_summary(monkeypatch):
+    """The summary of the last packets is logged without waiting for a new packet"""
+    now = [100.0]
+    monkeypatch.setattr(
+        traffic_stats, "time", SimpleNamespace(monotonic=lambda: now[0])
+    )
+    messages = []
+    sink = logger.add(messages.append, format="{message}")
+    try:
+        counter = TrafficCounter(name="test", action="Received", interval=10.0)
+        counter.add(100)
+        counter.add(50)
+        counter.idle()
+        assert messages == []
+        now[0] += 10.0
+        counter.idle()
+        assert len(messages) == 1
+        assert "Received 2 packets (150 bytes" in messages[0]
+        assert counter.total_packets == 2
+        # idle intervals without packets are not logged
+        now[0] += 10.0
+        counter.idle()
+        assert len(messages) == 1
+        assert counter.last_summary == now[0]
+    finally:
+        logger.remove(sink)